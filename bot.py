@@ -1,43 +1,105 @@
 from unicodedata import category
 import discord
 from discord import app_commands
+from discord.ext import tasks
 import sqlite3
 import json
 import os
+import asyncio
+import re
+import time
+import hashlib
+import gzip
+import csv
+import sys
+import argparse
+import threading
+import tracemalloc
+from array import array
+from collections import OrderedDict, deque
+from heapq import nlargest
+from bisect import bisect_left, insort
+from typing import NamedTuple
+from abc import ABC, abstractmethod
 
 TOKEN = "token"
+# Set to a guild ID to sync commands only to that guild (instant, for staging)
+SYNC_GUILD_ID = os.getenv("SYNC_GUILD_ID")
+# Channel that receives moderation alerts (win trading, boosting)
+ADMIN_CHANNEL_ID = int(os.getenv("ADMIN_CHANNEL_ID", "0"))
+# Set to 1 to enable the privileged Server Members intent, which /bulkregister needs.
+# It must also be switched on in the Developer Portal (Bot → Privileged Gateway Intents),
+# otherwise Discord refuses the connection.
+MEMBERS_INTENT = os.getenv("MEMBERS_INTENT", "0") == "1"
+# "sqlite" (default) or "memory" (nothing persisted, for tests and benchmarks)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")
+
+# Elo decay for inactive players
+DECAY_INTERVAL_HOURS = float(os.getenv("DECAY_INTERVAL_HOURS", "24"))
+DECAY_INACTIVE_DAYS = int(os.getenv("DECAY_INACTIVE_DAYS", "14"))  # no match in a category for this long counts as inactive
+DECAY_AMOUNT = int(os.getenv("DECAY_AMOUNT", "10"))                # Elo removed per run
+DECAY_FLOOR = int(os.getenv("DECAY_FLOOR", "1000"))                # decay never pushes a rating below this
 
 class PvPBot(discord.Client):
     def __init__(self):
         intents = discord.Intents.default()
+        intents.members = MEMBERS_INTENT  # Needed to stream guild members for bulk registration
         super().__init__(intents=intents)
         self.tree = app_commands.CommandTree(self)
+        self.started_at = time.perf_counter()
+        self.startup_reported = False
 
     async def setup_hook(self):
-        await self.tree.sync()  # Registers slash commands globally
-        print("Slash commands synced.")
+        hook_started = time.perf_counter()
+        open_storage()
+        watch_categories.start()
+        self.add_dynamic_items(PvPButton)
+        self.decay_loop.start()
+        await sync_commands(self)
+        print(f"⏱️ setup_hook took {time.perf_counter() - hook_started:.2f}s")
+
+    # Checks hourly and only decays once the interval has passed since the last run (kept in meta),
+    # so restarts don't apply extra decay
+    @tasks.loop(hours=1)
+    async def decay_loop(self):
+        try:
+            last_run = storage.get_meta("last_decay_at")
+            if last_run is not None and time.time() - float(last_run) < DECAY_INTERVAL_HOURS * 3600:
+                return
+            apply_elo_decay()
+            storage.set_meta("last_decay_at", str(int(time.time())))
+        except Exception as e:
+            print(f"❌ Elo decay failed: {e}")
 
 bot = PvPBot()
 
 @bot.event
 async def on_ready():
     print(f"✅ Bot logged in as {bot.user}")
+    # Seed the player name index from whatever members the client has cached
+    remember_names(m for m in bot.get_all_members() if player_store.overall(m.id) is not None)
+    if not bot.startup_reported:
+        bot.startup_reported = True
+        print(f"⏱️ Startup took {time.perf_counter() - bot.started_at:.2f}s")
 
 @bot.event
 async def on_error(event, *args, **kwargs):
     print(f"❌ Error in {event}: {args}, {kwargs}")
-    conn.commit()  # Ensure data is saved on error
+    if storage is not None:
+        storage.commit()  # Ensure data is saved on error
 
 # Graceful shutdown handler
 import atexit
 
 def close_database():
     """Safely close database on bot shutdown."""
+    global storage
+    if storage is None or not storage.persistent:
+        return
     try:
         # Dump players table to JSON
         try:
-            c.execute("SELECT user_id, category, kills, deaths, wins, losses, winstreak, elo FROM players")
-            rows = c.fetchall()
+            rows = storage.iter_players(with_activity=True)
             players_list = []
             for row in rows:
                 players_list.append({
@@ -48,7 +110,8 @@ def close_database():
                     "wins": row[4],
                     "losses": row[5],
                     "winstreak": row[6],
-                    "elo": row[7]
+                    "elo": row[7],
+                    "last_active": row[8]
                 })
 
             with open("players.json", "w", encoding="utf-8") as f:
@@ -59,8 +122,7 @@ def close_database():
 
         # Dump bans table to JSON
         try:
-            c.execute("SELECT user_id, reason, banned_at FROM bans")
-            ban_rows = c.fetchall()
+            ban_rows = storage.list_bans()
             bans_list = []
             for row in ban_rows:
                 bans_list.append({
@@ -75,393 +137,1825 @@ def close_database():
         except Exception as e:
             print(f"⚠️ Failed to dump bans to JSON: {e}")
 
-        conn.commit()
-        conn.close()
+        storage.close()
+        storage = None
         print("✅ Database saved and closed.")
     except Exception as e:
         print(f"❌ Error closing database: {e}")
 
 atexit.register(close_database)
 
-# ---------------- DATABASE ----------------
-conn = sqlite3.connect("pvp_stats.db", check_same_thread=False)
-conn.isolation_level = None  # Autocommit mode
-c = conn.cursor()
-
-# --- PLAYERS TABLE ---
-c.execute("""
-CREATE TABLE IF NOT EXISTS players (
-    user_id INTEGER,
-    category TEXT,
-    kills INTEGER DEFAULT 0,
-    deaths INTEGER DEFAULT 0,
-    wins INTEGER DEFAULT 0,
-    losses INTEGER DEFAULT 0,
-    winstreak INTEGER DEFAULT 0,
-    elo INTEGER DEFAULT 1000,
-    PRIMARY KEY (user_id, category)
-)
-""")
-conn.commit()
-
-# --- BANS TABLE ---
-c.execute("""
-CREATE TABLE IF NOT EXISTS bans (
-    user_id INTEGER PRIMARY KEY,
-    banned_at TEXT DEFAULT CURRENT_TIMESTAMP,
-    reason TEXT
-)
-""")
-conn.commit()
-
-# --- HISTORY TABLE ---
-c.execute("""
-CREATE TABLE IF NOT EXISTS history (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER,
-    category TEXT,
-    action TEXT,
-    details TEXT,
-    created_at TEXT DEFAULT CURRENT_TIMESTAMP
-)
-""")
-conn.commit()
+# ---------------- STORAGE ----------------
+DB_PATH = "pvp_stats.db"
+PLAYER_STAT_COLUMNS = ("kills", "deaths", "wins", "losses", "winstreak", "elo")
 
-# --- LOAD PLAYERS FROM JSON ---
-if os.path.exists("players.json"):
-    try:
-        with open("players.json", "r", encoding="utf-8") as f:
-            data = json.load(f)
-        loaded = 0
-        for p in data.get("players", []):
-            try:
-                uid = int(p.get("user_id"))
-                cat = p.get("category", "sword")
-                kills = int(p.get("kills", 0))
-                deaths = int(p.get("deaths", 0))
-                wins = int(p.get("wins", 0))
-                losses = int(p.get("losses", 0))
-                winstreak = int(p.get("winstreak", 0))
-                elo = int(p.get("elo", 1000))
-
-                c.execute(
-                    "INSERT OR REPLACE INTO players (user_id, category, kills, deaths, wins, losses, winstreak, elo) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                    (uid, cat, kills, deaths, wins, losses, winstreak, elo),
-                )
-                loaded += 1
-            except Exception:
-                continue
+class Storage(ABC):
+    """
+    Persistence for players, bans and history.
+    Player rows use the players table layout: (user_id, category, kills, deaths, wins, losses, winstreak, elo).
+    """
+
+    persistent = True  # close_database backs persistent stores up to JSON
+
+    # --- players ---
+    @abstractmethod
+    def iter_players(self, with_activity: bool = False):
+        """Every player row (plus last_active when with_activity is set)."""
+
+    @abstractmethod
+    def get_player(self, user_id: int, category: str):
+        ...
+
+    @abstractmethod
+    def ensure_player(self, user_id: int, category: str):
+        """Create a default row if the player has none in this category."""
+
+    @abstractmethod
+    def register_players(self, user_ids: list[int], categories: list[str]) -> int:
+        """Create default rows for every (user, category) pair in one transaction. Returns rows created."""
+
+    @abstractmethod
+    def delete_players(self, user_ids: list[int]) -> int:
+        """Delete every row for the given users in one transaction. Returns rows deleted."""
+
+    @abstractmethod
+    def update_player(self, user_id: int, category: str, fields: dict[str, int]):
+        ...
+
+    @abstractmethod
+    def record_match(self, winner_id: int, loser_id: int, category: str, kills: int, winner_gain: int, loser_loss: int, now: int):
+        """Apply a match result to both players (and any aggregates the backend keeps) atomically."""
+
+    @abstractmethod
+    def decay_ratings(self, categories: list[str], cutoff: int, amount: int, floor: int) -> dict[str, int]:
+        """Lower ratings inactive since before cutoff, never below floor. Returns rows touched per category."""
+
+    @abstractmethod
+    def import_players(self, rows: list[tuple]):
+        """Insert or replace rows of (user_id, category, kills, deaths, wins, losses, winstreak, elo, last_active)."""
+
+    # --- leaderboards ---
+    @abstractmethod
+    def leaderboard_page(self, scope: str, action: str, page: int, size: int,
+                         score: float | None = None, user_id: int | None = None) -> tuple[int, list, bool]:
+        """
+        (page, rows, has_next) ordered by (score DESC, user_id); rows are (user_id, score).
+        scope is 'all' (average Elo per user) or a category. action is 'next' / 'prev' (seek from the
+        (score, user_id) cursor) or 'page' (by number, clamped to the last page).
+        """
+
+    @abstractmethod
+    def leaderboard_rank(self, scope: str, user_id: int) -> int | None:
+        """Rows ranked ahead of the user, or None if they aren't on this leaderboard."""
+
+    # --- bans ---
+    @abstractmethod
+    def is_banned(self, user_id: int) -> bool:
+        ...
+
+    @abstractmethod
+    def banned_ids(self) -> set[int]:
+        ...
+
+    @abstractmethod
+    def add_ban(self, user_id: int, reason: str):
+        ...
+
+    @abstractmethod
+    def remove_ban(self, user_id: int):
+        ...
+
+    @abstractmethod
+    def list_bans(self) -> list[tuple[int, str, str]]:
+        """(user_id, reason, banned_at), newest first."""
+
+    @abstractmethod
+    def import_bans(self, rows: list[tuple[int, str, str]]):
+        ...
+
+    # --- history ---
+    @abstractmethod
+    def log_history(self, user_id: int | None, category: str | None, action: str, details: str):
+        ...
+
+    @abstractmethod
+    def recent_history(self, user_id: int | None = None, category: str | None = None, limit: int = 20) -> list[tuple]:
+        """(user_id, category, action, details, created_at), newest first."""
+
+    # --- player names ---
+    @abstractmethod
+    def player_names(self) -> list[tuple[int, str]]:
+        """Every remembered (user_id, display name)."""
+
+    @abstractmethod
+    def save_player_names(self, rows: list[tuple[int, str]]):
+        """Insert or update (user_id, display name) rows in one transaction."""
+
+    # --- bot settings ---
+    @abstractmethod
+    def get_meta(self, key: str) -> str | None:
+        ...
+
+    @abstractmethod
+    def set_meta(self, key: str, value: str):
+        ...
+
+    @abstractmethod
+    def delete_meta(self, key: str):
+        ...
+
+    @abstractmethod
+    def meta_with_prefix(self, prefix: str) -> dict[str, str]:
+        """Every meta key starting with prefix, mapped to its value."""
+
+    # --- lifecycle ---
+    def ensure_category_indexes(self, categories: list[str]):
+        """Backend-specific per-category indexes; nothing to do by default."""
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+class SQLiteStorage(Storage):
+    """
+    SQLite backend. Also owns the SQL-only extras (head-to-head, overall ratings,
+    player names, meta) that the rest of the bot reads through the module-level conn/c.
+    """
+
+    def __init__(self, path: str = DB_PATH):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.isolation_level = None  # Autocommit mode
+        self.c = self.conn.cursor()
+        # WAL lets readers (e.g. /export's snapshot) run alongside the bot's writes instead of locking them out
+        self.c.execute("PRAGMA journal_mode=WAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        c = self.c
+        conn = self.conn
+
+        # --- PLAYERS TABLE ---
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS players (
+            user_id INTEGER,
+            category TEXT,
+            kills INTEGER DEFAULT 0,
+            deaths INTEGER DEFAULT 0,
+            wins INTEGER DEFAULT 0,
+            losses INTEGER DEFAULT 0,
+            winstreak INTEGER DEFAULT 0,
+            elo INTEGER DEFAULT 1000,
+            PRIMARY KEY (user_id, category)
+        )
+        """)
         conn.commit()
-        print(f"✅ Loaded {loaded} player records from players.json")
-    except Exception as e:
-        print(f"⚠️ Failed to load players.json: {e}")
 
-# --- LOAD BANS FROM JSON ---
-if os.path.exists("bans.json"):
-    try:
-        with open("bans.json", "r", encoding="utf-8") as f:
-            data = json.load(f)
-        loaded_bans = 0
-        for b in data.get("bans", []):
-            try:
-                uid = int(b.get("user_id"))
-                reason = b.get("reason", "No reason provided")
-                banned_at = b.get("banned_at", "")
-
-                c.execute(
-                    "INSERT OR REPLACE INTO bans (user_id, reason, banned_at) VALUES (?, ?, ?)",
-                    (uid, reason, banned_at),
-                )
-                loaded_bans += 1
-            except Exception:
-                continue
+        # --- BANS TABLE ---
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS bans (
+            user_id INTEGER PRIMARY KEY,
+            banned_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            reason TEXT
+        )
+        """)
         conn.commit()
-        print(f"✅ Loaded {loaded_bans} ban records from bans.json")
-    except Exception as e:
-        print(f"⚠️ Failed to load bans.json: {e}")
-        
-CATEGORIES = ["sword", "axe", "mace", "crystal", "uhc"]
 
-async def category_autocomplete(interaction: discord.Interaction, current: str):
-    current = current.lower()
-    return [
-        app_commands.Choice(name=cat.upper(), value=cat)
-        for cat in CATEGORIES
-        if current in cat.lower()
-    ][:25]
-
-class CategoryPager(discord.ui.View):
-    def __init__(self, kind: str, target_user: discord.User | None = None, start: int = -1):
-        super().__init__(timeout=300)
-        self.kind = kind  # 'leaderboard' or 'stats'
-        self.target_user = target_user
-        self.index = start  # -1 = overall
-
-    async def update_message(self, interaction: discord.Interaction):
-        # -------------------------
-        # OVERALL PAGE
-        # -------------------------
-        if self.index == -1:
-            if self.kind == "leaderboard":
-                c.execute("""
-                    SELECT user_id, AVG(elo) AS avg_elo
-                    FROM players
-                    GROUP BY user_id
-                    ORDER BY avg_elo DESC
-                    LIMIT 10
-                """)
-                top = c.fetchall()
-
-                embed = discord.Embed(title="🏆 Overall Leaderboard", color=0xffd700)
-
-                for i, (user_id, avg_elo) in enumerate(top, start=1):
-                    try:
-                        user = await bot.fetch_user(user_id)
-                        display = user.display_name if user else f"Unknown ({user_id})"
-                    except:
-                        display = f"Unknown ({user_id})"
+        # --- HISTORY TABLE ---
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            category TEXT,
+            action TEXT,
+            details TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        conn.commit()
 
-                    embed.add_field(
-                        name=f"#{i} {display}",
-                        value=f"Average Elo: {int(round(avg_elo))}",
-                        inline=False
-                    )
+        # --- META TABLE ---
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+        """)
+        conn.commit()
 
-                await interaction.response.edit_message(embed=embed, view=self)
-                return
+        # --- HEAD TO HEAD TABLE ---
+        # One row per pair per category, player_a < player_b so each pair has a single key
+        c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'head_to_head'")
+        h2h_is_new = c.fetchone() is None
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS head_to_head (
+            category TEXT,
+            player_a INTEGER,
+            player_b INTEGER,
+            a_wins INTEGER DEFAULT 0,
+            b_wins INTEGER DEFAULT 0,
+            a_kills INTEGER DEFAULT 0,
+            b_kills INTEGER DEFAULT 0,
+            PRIMARY KEY (category, player_a, player_b)
+        )
+        """)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_h2h_pair ON head_to_head (player_a, player_b)")
+        if h2h_is_new:
+            # Matches logged before this point are only in history; /h2hbackfill picks them up
+            c.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM history")
+            c.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('h2h_backfill_before', ?)", (str(c.fetchone()[0]),))
+        conn.commit()
+
+        # --- PLAYER NAMES TABLE ---
+        # Last seen display name per user, so players can be found by name even when offline or gone
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS player_names (
+            user_id INTEGER PRIMARY KEY,
+            name TEXT
+        )
+        """)
+        conn.commit()
+
+        # --- ACTIVITY TRACKING ---
+        # Unix time of the last match per (user, category); drives Elo decay
+        c.execute("PRAGMA table_info(players)")
+        if "last_active" not in {row[1] for row in c.fetchall()}:
+            c.execute("ALTER TABLE players ADD COLUMN last_active INTEGER")
+        # No activity index: decay seeks on the category's rank index (elo > floor), and a
+        # (category, last_active) index would steal leaderboard queries from it
+        conn.commit()
+        # Rows without activity yet (older databases) start their inactivity clock now
+        c.execute("UPDATE players SET last_active = ? WHERE last_active IS NULL", (int(time.time()),))
+        conn.commit()
+
+        # --- OVERALL RATINGS TABLE ---
+        # Per-user average Elo, kept in sync by triggers so the overall leaderboard can page on an index
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS overall_ratings (
+            user_id INTEGER PRIMARY KEY,
+            elo_sum INTEGER,
+            categories INTEGER,
+            avg_elo REAL
+        )
+        """)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_overall_rank ON overall_ratings (avg_elo DESC, user_id)")
+        c.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_overall_insert AFTER INSERT ON players BEGIN
+            INSERT INTO overall_ratings (user_id, elo_sum, categories, avg_elo) VALUES (NEW.user_id, NEW.elo, 1, NEW.elo)
+            ON CONFLICT (user_id) DO UPDATE SET
+                elo_sum = elo_sum + NEW.elo,
+                categories = categories + 1,
+                avg_elo = (elo_sum + NEW.elo) * 1.0 / (categories + 1);
+        END
+        """)
+        c.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_overall_update AFTER UPDATE OF elo ON players BEGIN
+            UPDATE overall_ratings SET
+                elo_sum = elo_sum - OLD.elo + NEW.elo,
+                avg_elo = (elo_sum - OLD.elo + NEW.elo) * 1.0 / categories
+            WHERE user_id = NEW.user_id;
+        END
+        """)
+        c.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_overall_delete AFTER DELETE ON players BEGIN
+            UPDATE overall_ratings SET
+                elo_sum = elo_sum - OLD.elo,
+                categories = categories - 1,
+                avg_elo = CASE WHEN categories > 1 THEN (elo_sum - OLD.elo) * 1.0 / (categories - 1) END
+            WHERE user_id = OLD.user_id;
+            DELETE FROM overall_ratings WHERE user_id = OLD.user_id AND categories <= 0;
+        END
+        """)
+        self.rebuild_overall_ratings()
+
+    def rebuild_overall_ratings(self):
+        # INSERT OR REPLACE skips delete triggers, so bulk imports rebuild this table from scratch
+        self.c.execute("BEGIN")
+        self.c.execute("DELETE FROM overall_ratings")
+        self.c.execute("""
+            INSERT INTO overall_ratings (user_id, elo_sum, categories, avg_elo)
+            SELECT user_id, SUM(elo), COUNT(*), AVG(elo) FROM players GROUP BY user_id
+        """)
+        self.c.execute("COMMIT")
+
+    def _transaction(self, work):
+        self.c.execute("BEGIN")
+        try:
+            result = work()
+            self.c.execute("COMMIT")
+        except Exception:
+            self.c.execute("ROLLBACK")
+            raise
+        return result
+
+    # --- players ---
+    def iter_players(self, with_activity: bool = False):
+        cursor = self.conn.cursor()
+        columns = "user_id, category, kills, deaths, wins, losses, winstreak, elo"
+        cursor.execute(f"SELECT {columns}{', last_active' if with_activity else ''} FROM players")
+        return cursor
+
+    def get_player(self, user_id: int, category: str):
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT user_id, category, kills, deaths, wins, losses, winstreak, elo FROM players WHERE user_id = ? AND category = ?",
+            (user_id, category)
+        )
+        return cursor.fetchone()
+
+    def ensure_player(self, user_id: int, category: str):
+        self.c.execute(
+            "INSERT OR IGNORE INTO players (user_id, category, last_active) VALUES (?, ?, ?)",
+            (user_id, category, int(time.time()))
+        )
 
-            else:  # overall stats
-                target = self.target_user or interaction.user
-
-                c.execute("""
-                    SELECT
-                        SUM(kills),
-                        SUM(deaths),
-                        SUM(wins),
-                        SUM(losses),
-                        MAX(winstreak),
-                        AVG(elo)
-                    FROM players
-                    WHERE user_id = ?
-                """, (target.id,))
-                row = c.fetchone()
-
-                if not row or row[0] is None:
-                    embed = discord.Embed(
-                        title=f"📊 Overall Stats for {target.display_name}",
-                        description="No stats found.",
-                        color=0x00ff00
-                    )
-                    await interaction.response.edit_message(embed=embed, view=self)
-                    return
-
-                kills, deaths, wins, losses, streak, avg_elo = row
-                kd = round(kills / deaths, 2) if deaths and deaths > 0 else kills
-                elo_display = int(round(avg_elo)) if avg_elo is not None else 0
-
-                embed = discord.Embed(
-                    title=f"📊 Overall Stats for {target.display_name}",
-                    color=0x00ff00,
+    def register_players(self, user_ids: list[int], categories: list[str]) -> int:
+        now = int(time.time())
+
+        def work():
+            inserted = 0
+            for start in range(0, len(user_ids), BULK_REGISTER_CHUNK):
+                chunk = user_ids[start:start + BULK_REGISTER_CHUNK]
+                self.c.executemany(
+                    "INSERT OR IGNORE INTO players (user_id, category, last_active) VALUES (?, ?, ?)",
+                    [(uid, cat, now) for uid in chunk for cat in categories],
                 )
-                embed.add_field(name="Kills", value=kills)
-                embed.add_field(name="Deaths", value=deaths)
-                embed.add_field(name="K/D", value=kd)
-                embed.add_field(name="Wins", value=wins)
-                embed.add_field(name="Losses", value=losses)
-                embed.add_field(name="Best Win Streak", value=streak)
-                embed.add_field(name="Average Elo", value=elo_display)
-
-                await interaction.response.edit_message(embed=embed, view=self)
-                return
+                # rowcount leaves out the overall_ratings trigger writes
+                inserted += self.c.rowcount
+            return inserted
+
+        return self._transaction(work)
 
-        # -------------------------
-        # CATEGORY PAGE
-        # -------------------------
-        category = CATEGORIES[self.index]
+    def delete_players(self, user_ids: list[int]) -> int:
+        def work():
+            self.c.execute("CREATE TEMP TABLE IF NOT EXISTS wipe_ids (user_id INTEGER PRIMARY KEY)")
+            self.c.execute("DELETE FROM wipe_ids")
+            self.c.executemany("INSERT OR IGNORE INTO wipe_ids (user_id) VALUES (?)", [(uid,) for uid in user_ids])
+            self.c.execute("DELETE FROM players WHERE user_id IN (SELECT user_id FROM wipe_ids)")
+            return self.c.rowcount
 
-        if self.kind == "leaderboard":
-            c.execute("SELECT user_id, elo FROM players WHERE category = ? ORDER BY elo DESC LIMIT 10", (category,))
-            top = c.fetchall()
+        return self._transaction(work)
 
-            embed = discord.Embed(title=f"🏆 {category.upper()} Leaderboard", color=0xffd700)
-            for i, (user_id, elo) in enumerate(top, start=1):
+    def update_player(self, user_id: int, category: str, fields: dict[str, int]):
+        columns = [name for name in fields if name in PLAYER_STAT_COLUMNS]
+        if not columns:
+            return
+        query = "UPDATE players SET " + ", ".join(f"{name} = ?" for name in columns) + " WHERE user_id = ? AND category = ?"
+        self.c.execute(query, [fields[name] for name in columns] + [user_id, category])
+
+    def record_head_to_head(self, winner_id: int, loser_id: int, category: str, kills: int, matches: int = 1):
+        """Add a result to the pairwise head-to-head table (caller owns the transaction)."""
+        kills = max(0, kills)
+        if winner_id < loser_id:
+            row = (category, winner_id, loser_id, matches, 0, kills, 0)
+        else:
+            row = (category, loser_id, winner_id, 0, matches, 0, kills)
+        self.c.execute(
+            """
+            INSERT INTO head_to_head (category, player_a, player_b, a_wins, b_wins, a_kills, b_kills)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (category, player_a, player_b) DO UPDATE SET
+                a_wins = a_wins + excluded.a_wins,
+                b_wins = b_wins + excluded.b_wins,
+                a_kills = a_kills + excluded.a_kills,
+                b_kills = b_kills + excluded.b_kills
+            """,
+            row,
+        )
+
+    def record_match(self, winner_id: int, loser_id: int, category: str, kills: int, winner_gain: int, loser_loss: int, now: int):
+        def work():
+            self.c.execute(
+                "UPDATE players SET kills = MAX(0, kills + ?), wins = wins + 1, winstreak = winstreak + 1, elo = MAX(0, elo + ?), last_active = ? WHERE user_id = ? AND category = ?",
+                (kills, winner_gain, now, winner_id, category)
+            )
+            self.c.execute(
+                "UPDATE players SET deaths = MAX(0, deaths + ?), losses = losses + 1, winstreak = 0, elo = MAX(0, elo + ?), last_active = ? WHERE user_id = ? AND category = ?",
+                (kills, loser_loss, now, loser_id, category)
+            )
+            self.record_head_to_head(winner_id, loser_id, category, kills)
+
+        self._transaction(work)
+
+    def decay_ratings(self, categories: list[str], cutoff: int, amount: int, floor: int) -> dict[str, int]:
+        def work():
+            affected = {}
+            for cat in categories:
+                self.c.execute(
+                    "UPDATE players SET elo = MAX(?, elo - ?) WHERE category = ? AND last_active < ? AND elo > ?",
+                    (floor, amount, cat, cutoff, floor)
+                )
+                affected[cat] = self.c.rowcount
+            return affected
+
+        return self._transaction(work)
+
+    def import_players(self, rows: list[tuple]):
+        def work():
+            self.c.executemany(
+                "INSERT OR REPLACE INTO players (user_id, category, kills, deaths, wins, losses, winstreak, elo, last_active) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.c.execute("UPDATE players SET last_active = ? WHERE last_active IS NULL", (int(time.time()),))
+
+        self._transaction(work)
+        self.rebuild_overall_ratings()
+
+    # --- leaderboards ---
+    def _leaderboard_source(self, scope: str) -> tuple[str, str]:
+        """(FROM ... WHERE clause, score column) for a scope: 'all' or a category name."""
+        if scope == "all":
+            return "overall_ratings WHERE 1 = 1", "avg_elo"
+        if not CATEGORY_NAME_RE.match(scope):
+            raise ValueError(f"invalid leaderboard scope: {scope}")
+        # Category is inlined so SQLite picks that category's partial covering index
+        return f"players WHERE category = '{scope}'", "elo"
+
+    def leaderboard_page(self, scope: str, action: str, page: int, size: int,
+                         score: float | None = None, user_id: int | None = None) -> tuple[int, list, bool]:
+        source, col = self._leaderboard_source(scope)
+        page = max(1, page)
+
+        if action == "next" and score is not None:
+            self.c.execute(
+                f"SELECT user_id, {col} FROM {source} AND {col} <= ? AND ({col} < ? OR user_id > ?) "
+                f"ORDER BY {col} DESC, user_id LIMIT ?",
+                (score, score, user_id, size + 1)
+            )
+            rows = self.c.fetchall()
+            return page, rows[:size], len(rows) > size
+
+        if action == "prev" and score is not None:
+            self.c.execute(
+                f"SELECT user_id, {col} FROM {source} AND {col} >= ? AND ({col} > ? OR user_id < ?) "
+                f"ORDER BY {col} ASC, user_id DESC LIMIT ?",
+                (score, score, user_id, size)
+            )
+            rows = self.c.fetchall()[::-1]
+            return page, rows, True
+
+        self.c.execute(
+            f"SELECT user_id, {col} FROM {source} ORDER BY {col} DESC, user_id LIMIT ? OFFSET ?",
+            (size + 1, (page - 1) * size)
+        )
+        rows = self.c.fetchall()
+        if not rows and page > 1:
+            self.c.execute(f"SELECT COUNT(*) FROM {source}")
+            last_page = max(1, -(-self.c.fetchone()[0] // size))
+            if last_page < page:
+                return self.leaderboard_page(scope, "page", last_page, size)
+        return page, rows[:size], len(rows) > size
+
+    def leaderboard_rank(self, scope: str, user_id: int) -> int | None:
+        source, col = self._leaderboard_source(scope)
+        self.c.execute(f"SELECT {col} FROM {source} AND user_id = ?", (user_id,))
+        row = self.c.fetchone()
+        if row is None:
+            return None
+        self.c.execute(f"SELECT COUNT(*) FROM {source} AND {col} >= ? AND ({col} > ? OR user_id < ?)", (row[0], row[0], user_id))
+        return self.c.fetchone()[0]
+
+    # --- bans ---
+    def is_banned(self, user_id: int) -> bool:
+        self.c.execute("SELECT 1 FROM bans WHERE user_id = ?", (user_id,))
+        return self.c.fetchone() is not None
+
+    def banned_ids(self) -> set[int]:
+        self.c.execute("SELECT user_id FROM bans")
+        return {row[0] for row in self.c.fetchall()}
+
+    def add_ban(self, user_id: int, reason: str):
+        self.c.execute("INSERT INTO bans (user_id, reason) VALUES (?, ?)", (user_id, reason))
+
+    def remove_ban(self, user_id: int):
+        self.c.execute("DELETE FROM bans WHERE user_id = ?", (user_id,))
+
+    def list_bans(self) -> list[tuple[int, str, str]]:
+        self.c.execute("SELECT user_id, reason, banned_at FROM bans ORDER BY banned_at DESC")
+        return self.c.fetchall()
+
+    def import_bans(self, rows: list[tuple[int, str, str]]):
+        self._transaction(lambda: self.c.executemany(
+            "INSERT OR REPLACE INTO bans (user_id, reason, banned_at) VALUES (?, ?, ?)", rows
+        ))
+
+    # --- history ---
+    def log_history(self, user_id: int | None, category: str | None, action: str, details: str):
+        self.c.execute(
+            "INSERT INTO history (user_id, category, action, details) VALUES (?, ?, ?, ?)",
+            (user_id, category, action, details),
+        )
+
+    def recent_history(self, user_id: int | None = None, category: str | None = None, limit: int = 20) -> list[tuple]:
+        params = []
+        query = "SELECT user_id, category, action, details, created_at FROM history WHERE 1=1"
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        if category is not None:
+            query += " AND category = ?"
+            params.append(category)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        self.c.execute(query, params)
+        return self.c.fetchall()
+
+    # --- player names ---
+    def player_names(self) -> list[tuple[int, str]]:
+        self.c.execute("SELECT user_id, name FROM player_names")
+        return self.c.fetchall()
+
+    def save_player_names(self, rows: list[tuple[int, str]]):
+        self._transaction(lambda: self.c.executemany(
+            "INSERT OR REPLACE INTO player_names (user_id, name) VALUES (?, ?)", rows
+        ))
+
+    # --- bot settings ---
+    def get_meta(self, key: str) -> str | None:
+        self.c.execute("SELECT value FROM meta WHERE key = ?", (key,))
+        row = self.c.fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        self.c.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def delete_meta(self, key: str):
+        self.c.execute("DELETE FROM meta WHERE key = ?", (key,))
+
+    def meta_with_prefix(self, prefix: str) -> dict[str, str]:
+        # Range scan on the primary key; avoids LIKE treating _ in the prefix as a wildcard
+        self.c.execute("SELECT key, value FROM meta WHERE key >= ? AND key < ?", (prefix, prefix + "\U0010ffff"))
+        return dict(self.c.fetchall())
+
+    # --- lifecycle ---
+    def ensure_category_indexes(self, categories: list[str]):
+        """Partial covering leaderboard index per category (no-op if it already exists)."""
+        for cat in categories:
+            # Names are validated against CATEGORY_NAME_RE, so they are safe to inline
+            self.c.execute(f"CREATE INDEX IF NOT EXISTS idx_players_rank_{cat} ON players (elo DESC, user_id, category) WHERE category = '{cat}'")
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+def _utc_timestamp() -> str:
+    # Same format as SQLite's CURRENT_TIMESTAMP
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+
+class MemoryStorage(Storage):
+    """Pure in-memory backend for tests and benchmarks. Everything except head-to-head stats."""
+
+    persistent = False
+
+    def __init__(self):
+        # (user_id, category) -> [kills, deaths, wins, losses, winstreak, elo, last_active]
+        self.players: dict[tuple[int, str], list] = {}
+        self.bans: dict[int, tuple[str, str]] = {}
+        self.history: list[tuple] = []
+        self.meta: dict[str, str] = {}
+        self.names: dict[int, str] = {}
+
+    # --- players ---
+    def iter_players(self, with_activity: bool = False):
+        for (user_id, category), values in list(self.players.items()):
+            yield (user_id, category, *(values if with_activity else values[:6]))
+
+    def get_player(self, user_id: int, category: str):
+        values = self.players.get((user_id, category))
+        return (user_id, category, *values[:6]) if values else None
+
+    def ensure_player(self, user_id: int, category: str):
+        # New rows start their inactivity clock at registration
+        self.players.setdefault((user_id, category), [0, 0, 0, 0, 0, 1000, int(time.time())])
+
+    def register_players(self, user_ids: list[int], categories: list[str]) -> int:
+        before = len(self.players)
+        for uid in user_ids:
+            for cat in categories:
+                self.ensure_player(uid, cat)
+        return len(self.players) - before
+
+    def delete_players(self, user_ids: list[int]) -> int:
+        doomed = set(user_ids)
+        keys = [key for key in self.players if key[0] in doomed]
+        for key in keys:
+            del self.players[key]
+        return len(keys)
+
+    def update_player(self, user_id: int, category: str, fields: dict[str, int]):
+        values = self.players.get((user_id, category))
+        if values is None:
+            return
+        for name, value in fields.items():
+            if name in PLAYER_STAT_COLUMNS:
+                values[PLAYER_STAT_COLUMNS.index(name)] = value
+
+    def record_match(self, winner_id: int, loser_id: int, category: str, kills: int, winner_gain: int, loser_loss: int, now: int):
+        winner = self.players.get((winner_id, category))
+        loser = self.players.get((loser_id, category))
+        if winner is not None:
+            winner[0] = max(0, winner[0] + kills)
+            winner[2] += 1
+            winner[4] += 1
+            winner[5] = max(0, winner[5] + winner_gain)
+            winner[6] = now
+        if loser is not None:
+            loser[1] = max(0, loser[1] + kills)
+            loser[3] += 1
+            loser[4] = 0
+            loser[5] = max(0, loser[5] + loser_loss)
+            loser[6] = now
+
+    def decay_ratings(self, categories: list[str], cutoff: int, amount: int, floor: int) -> dict[str, int]:
+        affected = dict.fromkeys(categories, 0)
+        for (_, category), values in self.players.items():
+            if category in affected and values[6] is not None and values[6] < cutoff and values[5] > floor:
+                values[5] = max(floor, values[5] - amount)
+                affected[category] += 1
+        return affected
+
+    def import_players(self, rows: list[tuple]):
+        now = int(time.time())
+        for user_id, category, *values in rows:
+            if values[6] is None:
+                values[6] = now
+            self.players[(user_id, category)] = list(values)
+
+    # --- leaderboards ---
+    def _ranked(self, scope: str) -> list[tuple[int, float]]:
+        """Whole leaderboard sorted by (score DESC, user_id); fine at test and benchmark sizes."""
+        if scope == "all":
+            totals: dict[int, list[int]] = {}
+            for (user_id, _), values in self.players.items():
+                entry = totals.setdefault(user_id, [0, 0])
+                entry[0] += values[5]
+                entry[1] += 1
+            rows = [(user_id, elo_sum / count) for user_id, (elo_sum, count) in totals.items()]
+        else:
+            rows = [(user_id, values[5]) for (user_id, category), values in self.players.items() if category == scope]
+        rows.sort(key=lambda row: (-row[1], row[0]))
+        return rows
+
+    def leaderboard_page(self, scope: str, action: str, page: int, size: int,
+                         score: float | None = None, user_id: int | None = None) -> tuple[int, list, bool]:
+        rows = self._ranked(scope)
+        page = max(1, page)
+        if action in ("next", "prev") and score is not None:
+            cursor = bisect_left([(-row[1], row[0]) for row in rows], (-score, user_id))
+            if action == "next":
+                if cursor < len(rows) and rows[cursor] == (user_id, score):
+                    cursor += 1  # cursor row belongs to the previous page
+                return page, rows[cursor:cursor + size], len(rows) > cursor + size
+            return page, rows[max(0, cursor - size):cursor], True
+        last_page = max(1, -(-len(rows) // size))
+        page = min(page, last_page)
+        start = (page - 1) * size
+        return page, rows[start:start + size], len(rows) > start + size
+
+    def leaderboard_rank(self, scope: str, user_id: int) -> int | None:
+        for rank, row in enumerate(self._ranked(scope)):
+            if row[0] == user_id:
+                return rank
+        return None
+
+    # --- bans ---
+    def is_banned(self, user_id: int) -> bool:
+        return user_id in self.bans
+
+    def banned_ids(self) -> set[int]:
+        return set(self.bans)
+
+    def add_ban(self, user_id: int, reason: str):
+        self.bans[user_id] = (reason, _utc_timestamp())
+
+    def remove_ban(self, user_id: int):
+        self.bans.pop(user_id, None)
+
+    def list_bans(self) -> list[tuple[int, str, str]]:
+        rows = [(user_id, reason, banned_at) for user_id, (reason, banned_at) in self.bans.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+    def import_bans(self, rows: list[tuple[int, str, str]]):
+        for user_id, reason, banned_at in rows:
+            self.bans[user_id] = (reason, banned_at)
+
+    # --- history ---
+    def log_history(self, user_id: int | None, category: str | None, action: str, details: str):
+        self.history.append((user_id, category, action, details, _utc_timestamp()))
+
+    def recent_history(self, user_id: int | None = None, category: str | None = None, limit: int = 20) -> list[tuple]:
+        rows = []
+        for row in reversed(self.history):
+            if (user_id is None or row[0] == user_id) and (category is None or row[1] == category):
+                rows.append(row)
+                if len(rows) >= limit:
+                    break
+        return rows
+
+    # --- player names ---
+    def player_names(self) -> list[tuple[int, str]]:
+        return list(self.names.items())
+
+    def save_player_names(self, rows: list[tuple[int, str]]):
+        self.names.update(rows)
+
+    # --- bot settings ---
+    def get_meta(self, key: str) -> str | None:
+        return self.meta.get(key)
+
+    def set_meta(self, key: str, value: str):
+        self.meta[key] = value
+
+    def delete_meta(self, key: str):
+        self.meta.pop(key, None)
+
+    def meta_with_prefix(self, prefix: str) -> dict[str, str]:
+        return {key: value for key, value in self.meta.items() if key.startswith(prefix)}
+
+# Opened lazily by open_storage() in setup_hook, so importing this module touches no files
+storage: Storage | None = None
+conn: sqlite3.Connection | None = None  # SQLite-only features (head-to-head) use these
+c: sqlite3.Cursor | None = None
+
+def load_json_backup(target: Storage):
+    """Restore players.json / bans.json written by close_database."""
+    if os.path.exists("players.json"):
+        try:
+            with open("players.json", "r", encoding="utf-8") as f:
+                data = json.load(f)
+            rows = []
+            for p in data.get("players", []):
+                try:
+                    rows.append((
+                        int(p.get("user_id")),
+                        p.get("category", "sword"),
+                        int(p.get("kills", 0)),
+                        int(p.get("deaths", 0)),
+                        int(p.get("wins", 0)),
+                        int(p.get("losses", 0)),
+                        int(p.get("winstreak", 0)),
+                        int(p.get("elo", 1000)),
+                        p.get("last_active"),
+                    ))
+                except Exception:
+                    continue
+            target.import_players(rows)
+            print(f"✅ Loaded {len(rows)} player records from players.json")
+        except Exception as e:
+            print(f"⚠️ Failed to load players.json: {e}")
+
+    if os.path.exists("bans.json"):
+        try:
+            with open("bans.json", "r", encoding="utf-8") as f:
+                data = json.load(f)
+            rows = []
+            for b in data.get("bans", []):
                 try:
-                    user = await bot.fetch_user(user_id)
-                    display = user.display_name if user else f"Unknown ({user_id})"
-                except:
-                    display = f"Unknown ({user_id})"
-                embed.add_field(name=f"#{i} {display}", value=f"Elo: {elo}", inline=False)
-
-            await interaction.response.edit_message(embed=embed, view=self)
-
-        else:  # stats
-            target = self.target_user or interaction.user
-            player = get_player(target.id, category)
-            kills, deaths, wins, losses, streak, elo = player[2:]
-            kd = round(kills / deaths, 2) if deaths > 0 else kills
-
-            embed = discord.Embed(title=f"📊 {category.upper()} Stats for {target.display_name}", color=0x00ff00)
-            embed.add_field(name="Kills", value=kills)
-            embed.add_field(name="Deaths", value=deaths)
-            embed.add_field(name="K/D", value=kd)
-            embed.add_field(name="Wins", value=wins)
-            embed.add_field(name="Losses", value=losses)
-            embed.add_field(name="Win Streak", value=streak)
-            embed.add_field(name="Elo", value=elo)
-
-            await interaction.response.edit_message(embed=embed, view=self)
-
-    @discord.ui.button(label="◀️ Prev", style=discord.ButtonStyle.secondary)
-    async def prev(self, interaction: discord.Interaction, button: discord.ui.Button):
-        # Move left: overall → last category → ... → first category → overall
-        if self.index == -1:
-            self.index = len(CATEGORIES) - 1
+                    rows.append((int(b.get("user_id")), b.get("reason", "No reason provided"), b.get("banned_at", "")))
+                except Exception:
+                    continue
+            target.import_bans(rows)
+            print(f"✅ Loaded {len(rows)} ban records from bans.json")
+        except Exception as e:
+            print(f"⚠️ Failed to load bans.json: {e}")
+
+def open_storage(backend: Storage | None = None) -> Storage:
+    """Open the storage backend (STORAGE_BACKEND unless one is passed) and warm the in-memory read models."""
+    global storage, conn, c
+    if storage is not None:
+        return storage
+    started = time.perf_counter()
+    if backend is None:
+        backend = MemoryStorage() if STORAGE_BACKEND == "memory" else SQLiteStorage(DB_PATH)
+    storage = backend
+    if isinstance(storage, SQLiteStorage):
+        conn, c = storage.conn, storage.c
+
+    load_json_backup(storage)
+    ensure_category_indexes()
+
+    player_store.load()
+    if len(player_store):
+        print(f"✅ Cached {len(player_store)} player rows in memory ({player_store.memory_bytes() / len(player_store):.1f} bytes/row)")
+    player_names.load(storage.player_names())
+    live_leaderboards.load()
+    print(f"✅ Storage ready ({type(storage).__name__}) in {time.perf_counter() - started:.2f}s")
+    return storage
+
+# ---------------- PLAYER STORE ----------------
+class PlayerStore:
+    """
+    Columnar in-memory copy of the players table for read paths.
+    - One typed array per column, so a row costs a few dozen bytes
+    - Open-addressing hash index on (user_id, category) stored in an array too
+    - SQLite stays the source of truth: every write refreshes the rows it touched
+    """
+
+    def __init__(self):
+        self.categories: list[str] = []
+        self._category_ids: dict[str, int] = {}
+        self.user_ids = array("q")
+        self.category_ids = array("B")
+        self.kills = array("i")
+        self.deaths = array("i")
+        self.wins = array("i")
+        self.losses = array("i")
+        self.winstreak = array("i")
+        self.elo = array("i")
+        self._columns = (
+            self.user_ids, self.category_ids, self.kills, self.deaths,
+            self.wins, self.losses, self.winstreak, self.elo,
+        )
+        self._slots = array("i", [-1] * 8)  # row number per slot, -1 = empty
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def _category_id(self, category: str, create: bool = False) -> int:
+        cat_id = self._category_ids.get(category, -1)
+        if cat_id == -1 and create:
+            cat_id = len(self.categories)
+            self.categories.append(category)
+            self._category_ids[category] = cat_id
+        return cat_id
+
+    def _home(self, user_id: int, cat_id: int) -> int:
+        return hash((user_id, cat_id)) & (len(self._slots) - 1)
+
+    def _find_slot(self, user_id: int, cat_id: int) -> int:
+        """Slot holding the row, or the empty slot where it would go."""
+        slots, mask = self._slots, len(self._slots) - 1
+        i = self._home(user_id, cat_id)
+        while True:
+            row = slots[i]
+            if row == -1 or (self.user_ids[row] == user_id and self.category_ids[row] == cat_id):
+                return i
+            i = (i + 1) & mask
+
+    def _rebuild_index(self, size: int):
+        self._slots = array("i", [-1]) * size
+        for row in range(len(self.user_ids)):
+            self._slots[self._find_slot(self.user_ids[row], self.category_ids[row])] = row
+
+    def _remove_slot(self, i: int):
+        # Backward-shift deletion keeps linear probing chains intact without tombstones
+        slots, mask = self._slots, len(self._slots) - 1
+        j = i
+        while True:
+            j = (j + 1) & mask
+            row = slots[j]
+            if row == -1:
+                break
+            k = self._home(self.user_ids[row], self.category_ids[row])
+            if (i < j and i < k <= j) or (i > j and (k > i or k <= j)):
+                continue
+            slots[i] = row
+            i = j
+        slots[i] = -1
+
+    def load(self):
+        """Reload everything from storage."""
+        for column in self._columns:
+            del column[:]
+        for user_id, cat, *values in storage.iter_players():
+            self.user_ids.append(user_id)
+            self.category_ids.append(self._category_id(cat, create=True))
+            for column, value in zip(self._columns[2:], values):
+                column.append(value)
+        size = 8
+        while size < len(self) * 2:
+            size *= 2
+        self._rebuild_index(size)
+
+    def get(self, user_id: int, category: str):
+        """Row in the same layout as SELECT * FROM players, or None."""
+        cat_id = self._category_id(category)
+        if cat_id == -1:
+            return None
+        row = self._slots[self._find_slot(user_id, cat_id)]
+        if row == -1:
+            return None
+        return (user_id, category) + tuple(column[row] for column in self._columns[2:])
+
+    def overall(self, user_id: int):
+        """(kills, deaths, wins, losses, best winstreak, average elo) across categories, or None."""
+        rows = []
+        for cat_id in range(len(self.categories)):
+            row = self._slots[self._find_slot(user_id, cat_id)]
+            if row != -1:
+                rows.append(row)
+        if not rows:
+            return None
+        return (
+            sum(self.kills[r] for r in rows),
+            sum(self.deaths[r] for r in rows),
+            sum(self.wins[r] for r in rows),
+            sum(self.losses[r] for r in rows),
+            max(self.winstreak[r] for r in rows),
+            sum(self.elo[r] for r in rows) / len(rows),
+        )
+
+    def put(self, user_id: int, category: str, kills: int, deaths: int, wins: int, losses: int, winstreak: int, elo: int):
+        cat_id = self._category_id(category, create=True)
+        slot = self._find_slot(user_id, cat_id)
+        row = self._slots[slot]
+        values = (user_id, cat_id, kills, deaths, wins, losses, winstreak, elo)
+        if row == -1:
+            row = len(self)
+            for column, value in zip(self._columns, values):
+                column.append(value)
+            self._slots[slot] = row
+            if len(self) * 2 > len(self._slots):
+                self._rebuild_index(len(self._slots) * 2)
         else:
-            self.index -= 1
-            if self.index < -1:
-                self.index = -1
-        await self.update_message(interaction)
-
-    @discord.ui.button(label="Next ▶️", style=discord.ButtonStyle.secondary)
-    async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
-        # Move right: overall → first category → ... → last category → overall
-        if self.index == -1:
-            self.index = 0
+            for column, value in zip(self._columns, values):
+                column[row] = value
+
+    def discard(self, user_id: int, category: str):
+        cat_id = self._category_id(category)
+        if cat_id == -1:
+            return
+        slot = self._find_slot(user_id, cat_id)
+        row = self._slots[slot]
+        if row == -1:
+            return
+        self._remove_slot(slot)
+        # Move the last row into the hole so the columns stay dense
+        last = len(self) - 1
+        if row != last:
+            self._slots[self._find_slot(self.user_ids[last], self.category_ids[last])] = row
+            for column in self._columns:
+                column[row] = column[last]
+        for column in self._columns:
+            column.pop()
+
+    def refresh(self, user_id: int, category: str):
+        """Re-read one row from storage after a write."""
+        row = storage.get_player(user_id, category)
+        if row:
+            self.put(*row)
         else:
-            self.index += 1
-            if self.index >= len(CATEGORIES):
-                self.index = -1
-        await self.update_message(interaction)
+            self.discard(user_id, category)
+
+    def remove_user(self, user_id: int):
+        for category in list(self.categories):
+            self.discard(user_id, category)
+
+    def top(self, category: str, limit: int = 10) -> list[tuple[int, int]]:
+        """Top (user_id, elo) in a category, same order as the leaderboard (elo DESC, user_id)."""
+        cat_id = self._category_id(category)
+        if cat_id == -1:
+            return []
+        user_ids, elo = self.user_ids, self.elo
+        rows = (r for r, row_cat in enumerate(self.category_ids) if row_cat == cat_id)
+        best = nlargest(limit, rows, key=lambda r: (elo[r], -user_ids[r]))
+        return [(user_ids[r], elo[r]) for r in best]
+
+    def memory_bytes(self) -> int:
+        return sum(column.itemsize * len(column) for column in self._columns) + self._slots.itemsize * len(self._slots)
+
+player_store = PlayerStore()
+
+# ---------------- CATEGORIES ----------------
+CATEGORIES_FILE = "categories.json"
+DEFAULT_CATEGORIES = ["sword", "axe", "mace", "crystal", "uhc"]
+CATEGORY_NAME_RE = re.compile(r"^[a-z0-9_]{1,32}$")
+CATEGORIES_POLL_SECONDS = 5
+
+CATEGORIES: list[str] = []
+_categories_mtime: int | None = None
+# Every substring of every category -> autocomplete choices, so lookups are one dict hit
+_category_choices: dict[str, list[app_commands.Choice[str]]] = {}
+
+def ensure_category_indexes():
+    """Let the storage backend index new categories (before open_storage, it does this itself)."""
+    if storage is not None:
+        storage.ensure_category_indexes(CATEGORIES)
+
+def load_categories() -> bool:
+    """(Re)load categories.json if it changed. Returns True when the category list was updated."""
+    global _categories_mtime
+    try:
+        mtime = os.stat(CATEGORIES_FILE).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    if CATEGORIES and mtime == _categories_mtime:
+        return False
+    _categories_mtime = mtime
+
+    new_categories = DEFAULT_CATEGORIES
+    if mtime is not None:
+        try:
+            with open(CATEGORIES_FILE, "r", encoding="utf-8") as f:
+                loaded = json.load(f).get("categories", [])
+            if not loaded or not all(isinstance(cat, str) and CATEGORY_NAME_RE.match(cat) for cat in loaded):
+                raise ValueError("categories must be a non-empty list of lowercase names (a-z, 0-9, _)")
+            new_categories = list(dict.fromkeys(loaded))
+        except Exception as e:
+            print(f"⚠️ Failed to load {CATEGORIES_FILE}: {e}")
+            if CATEGORIES:
+                return False
+
+    if new_categories == CATEGORIES:
+        return False
+
+    # Mutate in place so anything holding a reference sees the new list
+    CATEGORIES[:] = new_categories
+    choices: dict[str, list[app_commands.Choice[str]]] = {}
+    for cat in CATEGORIES:
+        choice = app_commands.Choice(name=cat.upper(), value=cat)
+        substrings = {cat[i:j] for i in range(len(cat)) for j in range(i + 1, len(cat) + 1)}
+        for sub in substrings:
+            choices.setdefault(sub, []).append(choice)
+    choices[""] = [app_commands.Choice(name=cat.upper(), value=cat) for cat in CATEGORIES]
+    _category_choices.clear()
+    _category_choices.update({key: value[:25] for key, value in choices.items()})
+
+    ensure_category_indexes()
+    return True
+
+load_categories()
+
+@tasks.loop(seconds=CATEGORIES_POLL_SECONDS)
+async def watch_categories():
+    if load_categories():
+        print(f"🔄 Reloaded categories: {', '.join(CATEGORIES)}")
+
+async def category_autocomplete(interaction: discord.Interaction, current: str):
+    return _category_choices.get(current.lower(), [])
+
+def top_players(category: str, limit: int = 10) -> list[tuple[int, int]]:
+    """Top players in a category by Elo."""
+    if not CATEGORY_NAME_RE.match(category):
+        return []
+    return storage.leaderboard_page(category, "page", 1, limit)[1]
+
+# ---------------- PLAYER NAMES ----------------
+class PlayerNameIndex:
+    """
+    In-memory name lookup for player autocomplete.
+    - Sorted (lowercase name, user_id) list for prefix search via bisect
+    - Trigram -> user IDs map for substring search on longer queries
+    Names are persisted in player_names and refreshed whenever a user gets resolved.
+    """
+
+    SCAN_LIMIT = 2000  # max entries inspected per search, keeps autocomplete well under Discord's deadline
+
+    def __init__(self):
+        self.names: dict[int, str] = {}
+        self._sorted: list[tuple[str, int]] = []
+        self._trigrams: dict[str, set[int]] = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    @staticmethod
+    def _grams(name: str) -> set[str]:
+        return {name[i:i + 3] for i in range(len(name) - 2)}
+
+    def _remove(self, user_id: int):
+        old = self.names.pop(user_id, None)
+        if old is None:
+            return
+        lowered = old.lower()
+        i = bisect_left(self._sorted, (lowered, user_id))
+        if i < len(self._sorted) and self._sorted[i] == (lowered, user_id):
+            del self._sorted[i]
+        for gram in self._grams(lowered):
+            ids = self._trigrams.get(gram)
+            if ids is not None:
+                ids.discard(user_id)
+                if not ids:
+                    del self._trigrams[gram]
+
+    def load(self, rows):
+        """Bulk-index (user_id, name) rows; one sort instead of an insort per row."""
+        for user_id, name in rows:
+            self.names[user_id] = name
+            for gram in self._grams(name.lower()):
+                self._trigrams.setdefault(gram, set()).add(user_id)
+        self._sorted = sorted((name.lower(), user_id) for user_id, name in self.names.items())
+
+    def set(self, user_id: int, name: str) -> bool:
+        """Index a name. Returns True if it was new or changed."""
+        if self.names.get(user_id) == name:
+            return False
+        self._remove(user_id)
+        lowered = name.lower()
+        self.names[user_id] = name
+        insort(self._sorted, (lowered, user_id))
+        for gram in self._grams(lowered):
+            self._trigrams.setdefault(gram, set()).add(user_id)
+        return True
+
+    def find_exact(self, name: str) -> list[int]:
+        lowered = name.lower()
+        ids = []
+        i = bisect_left(self._sorted, (lowered,))
+        while i < len(self._sorted) and self._sorted[i][0] == lowered:
+            ids.append(self._sorted[i][1])
+            i += 1
+        return ids
+
+    def search(self, query: str, accept, limit: int = 25) -> list[int]:
+        """User IDs whose name starts with (then contains) the query, filtered by accept(user_id)."""
+        q = query.lower().strip()
+        found: list[int] = []
+        seen: set[int] = set()
+
+        i = bisect_left(self._sorted, (q,))
+        end = min(len(self._sorted), i + self.SCAN_LIMIT)
+        while i < end and len(found) < limit and self._sorted[i][0].startswith(q):
+            user_id = self._sorted[i][1]
+            if accept(user_id):
+                found.append(user_id)
+                seen.add(user_id)
+            i += 1
+
+        if len(q) >= 3 and len(found) < limit:
+            sets = sorted((self._trigrams.get(gram, set()) for gram in self._grams(q)), key=len)
+            candidates = set.intersection(*sets) if sets and sets[0] else set()
+            for scanned, user_id in enumerate(candidates):
+                if len(found) >= limit or scanned >= self.SCAN_LIMIT:
+                    break
+                if user_id not in seen and q in self.names[user_id].lower() and accept(user_id):
+                    found.append(user_id)
+        return found
+
+player_names = PlayerNameIndex()
+
+def remember_names(users):
+    """Index display names and persist the ones that changed."""
+    changed = [(user.id, user.display_name) for user in users if player_names.set(user.id, user.display_name)]
+    if changed:
+        # One transaction: in autocommit mode each row would be its own fsync
+        storage.save_player_names(changed)
+
+async def resolve_user(user_id: int) -> discord.User | None:
+    """Cached user if we have one, otherwise fetch it from Discord."""
+    user = bot.get_user(user_id)
+    if user is None:
+        try:
+            user = await bot.fetch_user(user_id)
+        except discord.HTTPException:
+            return None
+    remember_names([user])
+    return user
+
+async def display_name_for(user_id: int) -> str:
+    """Display name for leaderboards: client cache, then the name index, then the API."""
+    user = bot.get_user(user_id)
+    if user is None and user_id in player_names.names:
+        return player_names.names[user_id]
+    user = user or await resolve_user(user_id)
+    if user is None:
+        return f"Unknown ({user_id})"
+    remember_names([user])
+    return user.display_name
+
+class PlayerRef(NamedTuple):
+    """Just enough of a user for commands, even when Discord no longer knows them."""
+    id: int
+    display_name: str
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+USER_MENTION_RE = re.compile(r"^<@!?(\d+)>$")
+
+async def resolve_player_arg(value: str) -> PlayerRef | None:
+    """Turn an autocompleted ID, a mention, a raw ID or an exact name into a player."""
+    value = value.strip()
+    mention = USER_MENTION_RE.match(value)
+    if mention:
+        user_id = int(mention.group(1))
+    elif value.isdigit():
+        user_id = int(value)
+    else:
+        ids = player_names.find_exact(value)
+        if len(ids) != 1:
+            return None
+        user_id = ids[0]
+    user = await resolve_user(user_id)
+    if user is not None:
+        return PlayerRef(user.id, user.display_name)
+    return PlayerRef(user_id, player_names.names.get(user_id, f"Unknown ({user_id})"))
+
+async def player_autocomplete(interaction: discord.Interaction, current: str):
+    ids = player_names.search(current, accept=lambda uid: player_store.overall(uid) is not None)
+    return [
+        app_commands.Choice(name=f"{player_names.names[uid]} ({uid})"[:100], value=str(uid))
+        for uid in ids
+    ]
+
+# ---------------- PAGER ----------------
+# Pager, duel and duel result buttons keep no state in memory: everything they need is in the
+# button's custom_id ("pvp:<kind>:<args>"), and PvPButton parses it back when clicked.
+# That keeps memory flat however many messages are sent, and buttons keep working after a restart.
+
+async def resolve_page_target(interaction: discord.Interaction, target_id: int) -> tuple[int, str]:
+    """(user ID, display name) for a stats page; target 0 means whoever clicked."""
+    if not target_id:
+        return interaction.user.id, interaction.user.display_name
+    user = await resolve_user(target_id)
+    return target_id, user.display_name if user else f"Unknown ({target_id})"
+
+def pager_view(kind: str, index: int, target_id: int = 0) -> discord.ui.View:
+    """Prev/next buttons for the stats pager; index -1 is the overall page."""
+    # Cycle: overall → first category → ... → last category → overall
+    prev_index = len(CATEGORIES) - 1 if index == -1 else index - 1
+    next_index = index + 1 if index + 1 < len(CATEGORIES) else -1
+    view = discord.ui.View(timeout=None)
+    view.add_item(PvPButton("page", f"{kind}:prev:{prev_index}:{target_id}", label="◀️ Prev", style=discord.ButtonStyle.secondary))
+    view.add_item(PvPButton("page", f"{kind}:next:{next_index}:{target_id}", label="Next ▶️", style=discord.ButtonStyle.secondary))
+    return view
+
+async def build_page_embed(interaction: discord.Interaction, kind: str, index: int, target_id: int) -> discord.Embed:
+    """Stats page for the pager (leaderboards have their own paging, see LEADERBOARD PAGES)."""
+    # -------------------------
+    # OVERALL PAGE
+    # -------------------------
+    if index == -1:
+        target_id, target_name = await resolve_page_target(interaction, target_id)
+
+        row = player_store.overall(target_id)
+
+        if not row or row[0] is None:
+            embed = discord.Embed(
+                title=f"📊 Overall Stats for {target_name}",
+                description="No stats found.",
+                color=0x00ff00
+            )
+            return embed
+
+        kills, deaths, wins, losses, streak, avg_elo = row
+        kd = round(kills / deaths, 2) if deaths and deaths > 0 else kills
+        elo_display = int(round(avg_elo)) if avg_elo is not None else 0
+
+        embed = discord.Embed(
+            title=f"📊 Overall Stats for {target_name}",
+            color=0x00ff00,
+        )
+        embed.add_field(name="Kills", value=kills)
+        embed.add_field(name="Deaths", value=deaths)
+        embed.add_field(name="K/D", value=kd)
+        embed.add_field(name="Wins", value=wins)
+        embed.add_field(name="Losses", value=losses)
+        embed.add_field(name="Best Win Streak", value=streak)
+        embed.add_field(name="Average Elo", value=elo_display)
+
+        return embed
+
+    # -------------------------
+    # CATEGORY PAGE
+    # -------------------------
+    if index >= len(CATEGORIES):  # categories were reloaded since this page was rendered
+        return await build_page_embed(interaction, kind, -1, target_id)
+    category = CATEGORIES[index]
+
+    target_id, target_name = await resolve_page_target(interaction, target_id)
+    player = get_player(target_id, category)
+    kills, deaths, wins, losses, streak, elo = player[2:]
+    kd = round(kills / deaths, 2) if deaths > 0 else kills
+
+    embed = discord.Embed(title=f"📊 {category.upper()} Stats for {target_name}", color=0x00ff00)
+    embed.add_field(name="Kills", value=kills)
+    embed.add_field(name="Deaths", value=deaths)
+    embed.add_field(name="K/D", value=kd)
+    embed.add_field(name="Wins", value=wins)
+    embed.add_field(name="Losses", value=losses)
+    embed.add_field(name="Win Streak", value=streak)
+    embed.add_field(name="Elo", value=elo)
 
-    @discord.ui.button(label="◀️ Prev", style=discord.ButtonStyle.secondary)
-    async def prev(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.index = (self.index - 1) % len(CATEGORIES)
-        await self.update_message(interaction)
+    return embed
 
-    @discord.ui.button(label="Next ▶️", style=discord.ButtonStyle.secondary)
-    async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.index = (self.index + 1) % len(CATEGORIES)
-        await self.update_message(interaction)
+async def handle_page_button(interaction: discord.Interaction, args: list[str]):
+    kind, _, index, target_id = args
+    index, target_id = int(index), int(target_id)
+    embed = await build_page_embed(interaction, kind, index, target_id)
+    if index >= len(CATEGORIES):
+        index = -1
+    await interaction.response.edit_message(embed=embed, view=pager_view(kind, index, target_id))
 
 def get_player(user_id, category="sword"):
-    c.execute("SELECT * FROM players WHERE user_id = ? AND category = ?", (user_id, category))
-    player = c.fetchone()
+    player = player_store.get(user_id, category)
     if not player:
-        c.execute("INSERT INTO players (user_id, category) VALUES (?, ?)", (user_id, category))
-        conn.commit()
-        return get_player(user_id, category)
+        storage.ensure_player(user_id, category)
+        storage.commit()
+        player_store.refresh(user_id, category)
+        return player_store.get(user_id, category)
     return player
 
-class DuelView(discord.ui.View):
-    def __init__(self, challenger: discord.User, opponent: discord.User, category: str, kills: int):
-        super().__init__(timeout=300)
-        self.challenger = challenger
-        self.opponent = opponent
-        self.category = category
-        self.kills = kills
-
-    @discord.ui.button(label="Accept", style=discord.ButtonStyle.green)
-    async def accept(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if interaction.user.id != self.opponent.id:
-            await interaction.response.send_message("❌ Only the challenged player can accept!", ephemeral=True)
+async def record_match(winner_id: int, loser_id: int, category: str, kills: int, winner_gain: int, loser_loss: int):
+    """
+    Apply a match result to both players (and head-to-head, on SQLite) in one transaction.
+    Awaited under the player locks, so a backend that does I/O here can yield without racing other matches.
+    """
+    storage.record_match(winner_id, loser_id, category, kills, winner_gain, loser_loss, int(time.time()))
+    player_store.refresh(winner_id, category)
+    player_store.refresh(loser_id, category)
+
+def apply_elo_decay() -> int:
+    """Decay every inactive rating in one storage transaction."""
+    started = time.perf_counter()
+    cutoff = int(time.time()) - DECAY_INACTIVE_DAYS * 86400
+    affected = storage.decay_ratings(CATEGORIES, cutoff, DECAY_AMOUNT, DECAY_FLOOR)
+
+    total = sum(affected.values())
+    if total:
+        player_store.load()
+        live_leaderboards.mark_dirty(*(cat for cat, count in affected.items() if count))
+        log_history(None, None, "decay", f"Elo decay: -{DECAY_AMOUNT} for {total} inactive ratings")
+    per_category = ", ".join(f"{cat}: {count}" for cat, count in affected.items())
+    print(f"📉 Elo decay touched {total} rows ({per_category}) in {(time.perf_counter() - started) * 1000:.1f}ms")
+    return total
+
+# ---------------- MATCH SERIALIZATION ----------------
+class KeyedLocks:
+    """
+    One asyncio.Lock per key, created on demand and dropped once nobody holds or waits on it.
+    Work touching the same (user_id, category) runs one at a time; everything else runs in parallel.
+    """
+
+    def __init__(self):
+        self._locks: dict[tuple, asyncio.Lock] = {}
+        self._users: dict[tuple, int] = {}
+
+    def __len__(self):
+        return len(self._locks)
+
+    async def acquire(self, *keys: tuple) -> list[tuple]:
+        # Always lock in sorted order so two matches over the same pair can't deadlock
+        ordered = sorted(set(keys))
+        for key in ordered:
+            if key not in self._locks:
+                self._locks[key] = asyncio.Lock()
+            self._users[key] = self._users.get(key, 0) + 1
+        held = []
+        try:
+            for key in ordered:
+                await self._locks[key].acquire()
+                held.append(key)
+        except BaseException:
+            for key in held:
+                self._locks[key].release()
+            self._forget(ordered)
+            raise
+        return ordered
+
+    def release(self, keys: list[tuple]):
+        for key in keys:
+            self._locks[key].release()
+        self._forget(keys)
+
+    def _forget(self, keys: list[tuple]):
+        for key in keys:
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+                del self._locks[key]
+
+    def hold(self, *keys: tuple):
+        return _KeyedLockContext(self, keys)
+
+class _KeyedLockContext:
+    def __init__(self, locks: KeyedLocks, keys: tuple):
+        self._locks = locks
+        self._keys = keys
+        self._held: list[tuple] = []
+
+    async def __aenter__(self):
+        self._held = await self._locks.acquire(*self._keys)
+
+    async def __aexit__(self, *exc):
+        self._locks.release(self._held)
+
+match_locks = KeyedLocks()
+
+async def apply_match(winner_id: int, loser_id: int, category: str, kills: int) -> tuple[int, int]:
+    """Read both ratings, compute the Elo change and write it, holding both players' locks throughout."""
+    async with match_locks.hold((winner_id, category), (loser_id, category)):
+        # row layout: user_id, category, kills, deaths, wins, losses, winstreak, elo
+        winner_elo = get_player(winner_id, category)[7]
+        loser_elo = get_player(loser_id, category)[7]
+        winner_gain, loser_loss = calculate_elo_change(winner_elo, loser_elo, kills)
+        await record_match(winner_id, loser_id, category, kills, winner_gain, loser_loss)
+    live_leaderboards.mark_dirty(category)
+    return winner_gain, loser_loss
+
+# ---------------- WIN TRADING DETECTION ----------------
+class WinTradeDetector:
+    """
+    Online detector fed by every match result. Never reads history.
+    - Sliding window of win timestamps per (winner, loser, category)
+    - Sliding window of Elo gains per (player, category)
+    - Both maps are LRU-capped and each window is a bounded deque, so memory stays bounded
+    """
+
+    def __init__(self, window: float = 3600, max_keys: int = 50_000, pair_wins: int = 5,
+                 trade_wins: int = 3, elo_gain: int = 150, cooldown: float = 3600):
+        self.window = window
+        self.max_keys = max_keys
+        self.pair_wins = pair_wins    # same winner beating same loser this often is suspicious
+        self.trade_wins = trade_wins  # both sides of a pair winning this often looks like trading
+        self.elo_gain = elo_gain      # Elo gained inside the window that looks like boosting
+        self.cooldown = cooldown      # don't repeat the same alert more often than this
+        self._pairs: OrderedDict[tuple[int, int, str], deque] = OrderedDict()
+        self._gains: OrderedDict[tuple[int, str], deque] = OrderedDict()
+        self._flagged: OrderedDict[tuple, float] = OrderedDict()
+
+    def _window(self, table: OrderedDict, key, maxlen: int) -> deque:
+        events = table.get(key)
+        if events is None:
+            events = table[key] = deque(maxlen=maxlen)
+            if len(table) > self.max_keys:
+                table.popitem(last=False)
+        else:
+            table.move_to_end(key)
+        return events
+
+    def _expire(self, events: deque, now: float):
+        while events and now - events[0][0] > self.window:
+            events.popleft()
+
+    def _should_alert(self, key: tuple, now: float) -> bool:
+        last = self._flagged.get(key)
+        if last is not None and now - last < self.cooldown:
+            return False
+        self._flagged[key] = now
+        self._flagged.move_to_end(key)
+        if len(self._flagged) > self.max_keys:
+            self._flagged.popitem(last=False)
+        return True
+
+    def observe(self, winner_id: int, loser_id: int, category: str, winner_gain: int, now: float | None = None) -> list[str]:
+        """Record a match result and return any alerts it triggers."""
+        now = time.monotonic() if now is None else now
+        alerts = []
+
+        wins = self._window(self._pairs, (winner_id, loser_id, category), self.pair_wins * 4)
+        wins.append((now, winner_gain))
+        self._expire(wins, now)
+        reverse = self._pairs.get((loser_id, winner_id, category))
+        if reverse is not None:
+            self._expire(reverse, now)
+        reverse_wins = len(reverse) if reverse else 0
+
+        minutes = int(self.window // 60)
+        if len(wins) >= self.pair_wins and self._should_alert(("pair", winner_id, loser_id, category), now):
+            alerts.append(f"<@{winner_id}> beat <@{loser_id}> {len(wins)} times in **{category}** within {minutes} min")
+        if len(wins) >= self.trade_wins and reverse_wins >= self.trade_wins:
+            low, high = sorted((winner_id, loser_id))
+            if self._should_alert(("trade", low, high, category), now):
+                alerts.append(f"<@{winner_id}> and <@{loser_id}> are trading wins in **{category}** ({len(wins)}/{reverse_wins} within {minutes} min)")
+
+        gains = self._window(self._gains, (winner_id, category), 256)
+        gains.append((now, winner_gain))
+        self._expire(gains, now)
+        total_gain = sum(gain for _, gain in gains)
+        if total_gain >= self.elo_gain and self._should_alert(("elo", winner_id, category), now):
+            alerts.append(f"<@{winner_id}> gained {total_gain} Elo in **{category}** within {minutes} min")
+
+        return alerts
+
+win_trade_detector = WinTradeDetector()
+
+async def check_win_trading(winner_id: int, loser_id: int, category: str, winner_gain: int):
+    """Feed a result to the detector and post any alerts to the admin channel."""
+    alerts = win_trade_detector.observe(winner_id, loser_id, category, winner_gain)
+    if not alerts:
+        return
+    channel = bot.get_channel(ADMIN_CHANNEL_ID) if ADMIN_CHANNEL_ID else None
+    if channel is None:
+        for alert in alerts:
+            print(f"🚩 Suspicious activity: {alert}")
+        return
+    embed = discord.Embed(title="🚩 Suspicious Match Activity", description="\n".join(alerts), color=0xff0000)
+    try:
+        await channel.send(embed=embed, allowed_mentions=discord.AllowedMentions.none())
+    except discord.HTTPException as e:
+        print(f"⚠️ Failed to send win trading alert: {e}")
+
+# ---------------- LEADERBOARD PAGES ----------------
+# Keyset pagination on (score DESC, user_id): prev/next buttons carry the boundary row in their
+# custom_id and seek straight to it on the covering index, so stepping from page 499 to 500 costs
+# the same as page 1. Jumping to a page number ('page') and finding your own page ('me') have no
+# boundary row to seek from; they walk the covering index, so they cost O(rank) index entries.
+LEADERBOARD_PAGE_SIZE = 10
+
+def fetch_leaderboard_page(scope: str, action: str, page: int, score: float | None = None, user_id: int | None = None):
+    """
+    Returns (page, rows, has_next) where rows are (user_id, score).
+    - 'next': rows after the (score, user_id) cursor
+    - 'prev': rows before the cursor
+    - 'page': page by number (jump / my position) via OFFSET, O(offset); clamps to the last page
+    """
+    if scope != "all" and not CATEGORY_NAME_RE.match(scope):
+        raise ValueError(f"invalid leaderboard scope: {scope}")
+    return storage.leaderboard_page(scope, action, page, LEADERBOARD_PAGE_SIZE, score, user_id)
+
+def leaderboard_position_page(scope: str, user_id: int) -> int | None:
+    """Page number the user is on, or None if they aren't on this leaderboard."""
+    ahead = storage.leaderboard_rank(scope, user_id)
+    if ahead is None:
+        return None
+    return ahead // LEADERBOARD_PAGE_SIZE + 1
+
+def leaderboard_view(scope: str, page: int, rows: list, has_next: bool) -> discord.ui.View:
+    scopes = ["all", *CATEGORIES]
+    pos = scopes.index(scope) if scope in scopes else 0
+    view = discord.ui.View(timeout=None)
+    # Row 0: switch leaderboard (overall → categories → overall)
+    view.add_item(PvPButton("lb", f"catprev:{scopes[pos - 1]}:1", label="◀️ Prev", style=discord.ButtonStyle.secondary, row=0))
+    view.add_item(PvPButton("lb", f"catnext:{scopes[(pos + 1) % len(scopes)]}:1", label="Next ▶️", style=discord.ButtonStyle.secondary, row=0))
+    # Row 1: page through this leaderboard
+    first = rows[0] if rows else (None, None)
+    last = rows[-1] if rows else (None, None)
+    prev_button = PvPButton("lb", f"prev:{scope}:{page - 1}:{first[1]}:{first[0]}", label="⏪ Page", style=discord.ButtonStyle.primary, row=1)
+    prev_button.item.disabled = page <= 1 or not rows
+    next_button = PvPButton("lb", f"next:{scope}:{page + 1}:{last[1]}:{last[0]}", label="Page ⏩", style=discord.ButtonStyle.primary, row=1)
+    next_button.item.disabled = not has_next
+    view.add_item(prev_button)
+    view.add_item(next_button)
+    view.add_item(PvPButton("lb", f"jump:{scope}:{page}", label="🔢 Jump", style=discord.ButtonStyle.secondary, row=1))
+    view.add_item(PvPButton("lb", f"me:{scope}:{page}", label="📍 Me", style=discord.ButtonStyle.secondary, row=1))
+    return view
+
+async def render_leaderboard(scope: str, page: int, rows: list, has_next: bool) -> tuple[discord.Embed, discord.ui.View]:
+    title = "🏆 Overall Leaderboard" if scope == "all" else f"🏆 {scope.upper()} Leaderboard"
+    embed = discord.Embed(title=title, color=0xffd700)
+    for i, (user_id, score) in enumerate(rows, start=(page - 1) * LEADERBOARD_PAGE_SIZE + 1):
+        display = await display_name_for(user_id)
+        value = f"Average Elo: {int(round(score))}" if scope == "all" else f"Elo: {score}"
+        embed.add_field(name=f"#{i} {display}", value=value, inline=False)
+    if not rows:
+        embed.description = "No players yet."
+    embed.set_footer(text=f"Page {page}")
+    return embed, leaderboard_view(scope, page, rows, has_next)
+
+class JumpToPageModal(discord.ui.Modal, title="Jump to page"):
+    page = discord.ui.TextInput(label="Page number", placeholder="e.g. 5", max_length=7)
+
+    def __init__(self, scope: str):
+        super().__init__()
+        self.scope = scope
+
+    async def on_submit(self, interaction: discord.Interaction):
+        if not self.page.value.strip().isdigit():
+            await interaction.response.send_message("❌ Enter a page number!", ephemeral=True)
             return
-        
-        # Create winner selection view
-        winner_view = DuelResultView(self.challenger, self.opponent, self.category, self.kills)
-        
-        embed = discord.Embed(title="⚔️ Duel In Progress", color=0xff6600)
-        embed.add_field(name="Challenger", value=self.challenger.mention)
-        embed.add_field(name="Opponent", value=self.opponent.mention)
-        embed.add_field(name="Category", value=self.category.upper())
-        embed.set_footer(text="Who won the duel?")
-        
-        await interaction.response.send_message(embed=embed, view=winner_view)
-        self.stop()
-
-    @discord.ui.button(label="Decline", style=discord.ButtonStyle.red)
-    async def decline(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if interaction.user.id != self.opponent.id:
-            await interaction.response.send_message("❌ Only the challenged player can decline!", ephemeral=True)
+        page, rows, has_next = fetch_leaderboard_page(self.scope, "page", int(self.page.value))
+        embed, view = await render_leaderboard(self.scope, page, rows, has_next)
+        await interaction.response.edit_message(embed=embed, view=view)
+
+async def handle_leaderboard_button(interaction: discord.Interaction, args: list[str]):
+    action, scope, page = args[0], args[1], int(args[2])
+    if scope != "all" and scope not in CATEGORIES:  # category removed since this was rendered
+        scope, action, page = "all", "page", 1
+
+    if action == "jump":
+        await interaction.response.send_modal(JumpToPageModal(scope))
+        return
+    if action == "me":
+        page = leaderboard_position_page(scope, interaction.user.id)
+        if page is None:
+            await interaction.response.send_message("❌ You're not on this leaderboard yet!", ephemeral=True)
             return
-        
-        await interaction.response.send_message(f"❌ {self.opponent.mention} declined the duel from {self.challenger.mention}!")
-        self.stop()
-
-class DuelResultView(discord.ui.View):
-    def __init__(self, challenger: discord.User, opponent: discord.User, category: str, kills: int):
-        super().__init__(timeout=300)
-        self.challenger = challenger
-        self.opponent = opponent
-        self.category = category
-        self.kills = kills
-
-    @discord.ui.button(label=f"Challenger Won", style=discord.ButtonStyle.blurple)
-    async def challenger_won(self, interaction: discord.Interaction, button: discord.ui.Button):
-        # Challenger won, opponent lost
-        winner = self.challenger
-        loser = self.opponent
-        
-        winner_data = get_player(winner.id, self.category)
-        loser_data = get_player(loser.id, self.category)
-        
-        winner_elo = winner_data[7]
-        loser_elo = loser_data[7]
-        
-        winner_gain, loser_loss = calculate_elo_change(winner_elo, loser_elo, self.kills)
-        
-        c.execute(
-            "UPDATE players SET kills = MAX(0, kills + ?), wins = wins + 1, winstreak = winstreak + 1, elo = MAX(0, elo + ?) WHERE user_id = ? AND category = ?",
-            (self.kills, winner_gain, winner.id, self.category)
-        )
-        c.execute(
-            "UPDATE players SET deaths = MAX(0, deaths + ?), losses = losses + 1, winstreak = 0, elo = MAX(0, elo + ?) WHERE user_id = ? AND category = ?",
-            (self.kills, loser_loss, loser.id, self.category)
-        )
-        conn.commit()
-        
-        log_history(
-            winner.id,
-            self.category,
-            "duel_win",
-            f"{winner.display_name} defeated {loser.display_name} (kills: {self.kills}, ΔELO: +{winner_gain}/{loser_loss})"
-        )
+        action = "page"
+
+    score = user_id = None
+    if action in ("prev", "next") and len(args) == 5 and args[4] != "None":
+        score, user_id = float(args[3]), int(args[4])
+    page, rows, has_next = fetch_leaderboard_page(scope, action, page, score, user_id)
+    embed, view = await render_leaderboard(scope, page, rows, has_next)
+    await interaction.response.edit_message(embed=embed, view=view)
+
+# ---------------- LIVE LEADERBOARDS ----------------
+# One message per category that the bot edits in place. Rating changes only mark a category dirty;
+# a single flusher waits out the burst, then edits each dirty board at most once per MIN_EDIT_INTERVAL.
+LIVE_LEADERBOARD_SIZE = 10
+
+def cached_display_name(user_id: int) -> str:
+    """Display name without touching the API: client cache, then the name index."""
+    user = bot.get_user(user_id)
+    if user is not None:
+        return user.display_name
+    return player_names.names.get(user_id, f"Unknown ({user_id})")
+
+def live_leaderboard_embed(category: str) -> discord.Embed:
+    """Rendered from the in-memory player store and name index only."""
+    embed = discord.Embed(title=f"🏆 {category.upper()} Leaderboard (live)", color=0xffd700)
+    rows = player_store.top(category, LIVE_LEADERBOARD_SIZE)
+    for i, (user_id, elo) in enumerate(rows, start=1):
+        embed.add_field(name=f"#{i} {cached_display_name(user_id)}", value=f"Elo: {elo}", inline=False)
+    if not rows:
+        embed.description = "No players yet."
+    embed.set_footer(text="Updates automatically")
+    embed.timestamp = discord.utils.utcnow()
+    return embed
 
-        await interaction.response.send_message(f"⚔️ Duel finished! {winner.mention} defeated {loser.mention} in **{self.category}**! (+{winner_gain} / {loser_loss} ELO)")
-        self.stop()
-
-    @discord.ui.button(label=f"Opponent Won", style=discord.ButtonStyle.blurple)
-    async def opponent_won(self, interaction: discord.Interaction, button: discord.ui.Button):
-        # Opponent won, challenger lost
-        winner = self.opponent
-        loser = self.challenger
-        
-        winner_data = get_player(winner.id, self.category)
-        loser_data = get_player(loser.id, self.category)
-        
-        winner_elo = winner_data[7]
-        loser_elo = loser_data[7]
-        
-        winner_gain, loser_loss = calculate_elo_change(winner_elo, loser_elo, self.kills)
-        
-        c.execute(
-            "UPDATE players SET kills = MAX(0, kills + ?), wins = wins + 1, winstreak = winstreak + 1, elo = MAX(0, elo + ?) WHERE user_id = ? AND category = ?",
-            (self.kills, winner_gain, winner.id, self.category)
-        )
-        c.execute(
-            "UPDATE players SET deaths = MAX(0, deaths + ?), losses = losses + 1, winstreak = 0, elo = MAX(0, elo + ?) WHERE user_id = ? AND category = ?",
-            (self.kills, loser_loss, loser.id, self.category)
-        )
-        conn.commit()
-        
-        log_history(
-            winner.id,
-            self.category,
-            "duel_win",
-            f"{winner.display_name} defeated {loser.display_name} (kills: {self.kills}, ΔELO: +{winner_gain}/{loser_loss})"
-        )
+class LiveLeaderboards:
+    """
+    Debounced, coalesced edits of the live leaderboard messages.
+    - mark_dirty() is O(1) and never awaits, so match reporting isn't slowed down
+    - Marks inside DEBOUNCE_SECONDS collapse into one edit per category
+    - Each message is edited at most once per MIN_EDIT_INTERVAL, well inside Discord's edit limits
+    Targets are stored in meta as live_leaderboard_<category> = "<channel_id>:<message_id>".
+    """
+
+    DEBOUNCE_SECONDS = 5.0
+    MIN_EDIT_INTERVAL = 15.0
+    META_PREFIX = "live_leaderboard_"
+
+    def __init__(self):
+        self.targets: dict[str, tuple[int, int]] = {}
+        self._dirty: set[str] = set()
+        self._last_edit: dict[str, float] = {}
+        self._last_rows: dict[str, list] = {}
+        self._task: asyncio.Task | None = None
+
+    def load(self):
+        for key, value in storage.meta_with_prefix(self.META_PREFIX).items():
+            channel_id, message_id = value.split(":")
+            self.targets[key.removeprefix(self.META_PREFIX)] = (int(channel_id), int(message_id))
+
+    def set_target(self, category: str, channel_id: int, message_id: int):
+        self.targets[category] = (channel_id, message_id)
+        self._last_edit[category] = time.monotonic()  # just posted with fresh data
+        self._last_rows[category] = player_store.top(category, LIVE_LEADERBOARD_SIZE)
+        storage.set_meta(self.META_PREFIX + category, f"{channel_id}:{message_id}")
+
+    def remove_target(self, category: str) -> tuple[int, int] | None:
+        self._dirty.discard(category)
+        self._last_rows.pop(category, None)
+        storage.delete_meta(self.META_PREFIX + category)
+        return self.targets.pop(category, None)
+
+    def mark_dirty(self, *categories: str):
+        """Schedule a refresh for these categories (all configured ones if none are given)."""
+        self._dirty.update(cat for cat in (categories or self.targets) if cat in self.targets)
+        if not self._dirty or (self._task is not None and not self._task.done()):
+            return
+        try:
+            self._task = asyncio.get_running_loop().create_task(self._flush())
+        except RuntimeError:
+            pass  # no event loop yet; the next mark from a command picks these up
+
+    async def _flush(self):
+        # Marks can arrive from setup_hook (decay) before guilds and channels are cached
+        await bot.wait_until_ready()
+        await asyncio.sleep(self.DEBOUNCE_SECONDS)
+        while self._dirty:
+            now = time.monotonic()
+            waits = {cat: self._last_edit.get(cat, 0.0) + self.MIN_EDIT_INTERVAL - now for cat in self._dirty}
+            ready = [cat for cat, wait in waits.items() if wait <= 0]
+            if not ready:
+                await asyncio.sleep(min(waits.values()))
+                continue
+            for cat in ready:
+                # Clear first so marks that arrive during the edit queue another one
+                self._dirty.discard(cat)
+                await self._edit(cat)
+
+    async def _edit(self, category: str):
+        target = self.targets.get(category)
+        if target is None:
+            return
+        rows = player_store.top(category, LIVE_LEADERBOARD_SIZE)
+        if rows == self._last_rows.get(category):
+            return  # standings unchanged (e.g. a match outside the top 10)
+        channel_id, message_id = target
+        self._last_edit[category] = time.monotonic()
+        try:
+            channel = bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+            await channel.get_partial_message(message_id).edit(embed=live_leaderboard_embed(category))
+        except (discord.NotFound, discord.Forbidden):
+            print(f"⚠️ Live leaderboard for {category} was deleted or can't be edited, disabling it")
+            self.remove_target(category)
+            return
+        except discord.HTTPException as e:
+            print(f"⚠️ Failed to update live leaderboard for {category}: {e}")
+            self._dirty.add(category)  # retry after the edit interval
+            return
+        self._last_rows[category] = rows
+
+live_leaderboards = LiveLeaderboards()
+
+# ---------------- DUELS ----------------
+DUEL_ACCEPT_SECONDS = 300
+DUEL_RESULT_SECONDS = 300  # result buttons expire like the old DuelResultView did
+# Result messages already handled; bounded, only guards against double clicks before the buttons are removed
+_finished_duels: OrderedDict[int, None] = OrderedDict()
+
+def duel_view(challenger_id: int, opponent_id: int, category: str, kills: int) -> discord.ui.View:
+    args = f"{challenger_id}:{opponent_id}:{category}:{kills}"
+    view = discord.ui.View(timeout=None)
+    view.add_item(PvPButton("duel", f"accept:{args}", label="Accept", style=discord.ButtonStyle.green))
+    view.add_item(PvPButton("duel", f"decline:{args}", label="Decline", style=discord.ButtonStyle.red))
+    return view
+
+def duel_result_view(challenger_id: int, opponent_id: int, category: str, kills: int) -> discord.ui.View:
+    view = discord.ui.View(timeout=None)
+    view.add_item(PvPButton("result", f"{challenger_id}:{opponent_id}:{category}:{kills}", label="Challenger Won", style=discord.ButtonStyle.blurple))
+    view.add_item(PvPButton("result", f"{opponent_id}:{challenger_id}:{category}:{kills}", label="Opponent Won", style=discord.ButtonStyle.blurple))
+    return view
+
+async def handle_duel_button(interaction: discord.Interaction, args: list[str]):
+    action, challenger_id, opponent_id, category, kills = args
+    challenger_id, opponent_id, kills = int(challenger_id), int(opponent_id), int(kills)
+
+    if interaction.user.id != opponent_id:
+        await interaction.response.send_message(f"❌ Only the challenged player can {action}!", ephemeral=True)
+        return
+
+    if (discord.utils.utcnow() - interaction.message.created_at).total_seconds() > DUEL_ACCEPT_SECONDS:
+        await interaction.response.edit_message(view=None)
+        await interaction.followup.send("⌛ This duel challenge has expired!")
+        return
 
-        await interaction.response.send_message(f"⚔️ Duel finished! {winner.mention} defeated {loser.mention} in **{self.category}**! (+{winner_gain} / {loser_loss} ELO)")
-        self.stop()
+    if action == "decline":
+        await interaction.response.edit_message(view=None)
+        await interaction.followup.send(f"❌ <@{opponent_id}> declined the duel from <@{challenger_id}>!")
+        return
+
+    embed = discord.Embed(title="⚔️ Duel In Progress", color=0xff6600)
+    embed.add_field(name="Challenger", value=f"<@{challenger_id}>")
+    embed.add_field(name="Opponent", value=f"<@{opponent_id}>")
+    embed.add_field(name="Category", value=category.upper())
+    embed.set_footer(text="Who won the duel?")
+
+    await interaction.response.edit_message(view=None)
+    await interaction.followup.send(embed=embed, view=duel_result_view(challenger_id, opponent_id, category, kills))
+
+async def handle_result_button(interaction: discord.Interaction, args: list[str]):
+    winner_id, loser_id, category, kills = args
+    winner_id, loser_id, kills = int(winner_id), int(loser_id), int(kills)
+
+    message_id = interaction.message.id
+    if message_id in _finished_duels:
+        await interaction.response.send_message("❌ This duel has already been decided!", ephemeral=True)
+        return
+    if category not in CATEGORIES:  # category removed since the duel was accepted
+        await interaction.response.edit_message(content=f"❌ **{category}** is no longer a category, duel cancelled.", view=None)
+        return
+    if (discord.utils.utcnow() - interaction.message.created_at).total_seconds() > DUEL_RESULT_SECONDS:
+        await interaction.response.edit_message(view=None)
+        await interaction.followup.send("⌛ This duel has expired, the result wasn't recorded!")
+        return
+    _finished_duels[message_id] = None
+    if len(_finished_duels) > 10_000:
+        _finished_duels.popitem(last=False)
+
+    # Answer within Discord's 3s window before the match write and user lookups
+    await interaction.response.edit_message(view=None)
+
+    winner_gain, loser_loss = await apply_match(winner_id, loser_id, category, kills)
+
+    winner = await resolve_user(winner_id)
+    loser = await resolve_user(loser_id)
+    winner_name = winner.display_name if winner else f"Unknown ({winner_id})"
+    loser_name = loser.display_name if loser else f"Unknown ({loser_id})"
+    log_history(
+        winner_id,
+        category,
+        "duel_win",
+        f"{winner_name} defeated {loser_name} (kills: {kills}, ΔELO: +{winner_gain}/{loser_loss})"
+    )
+
+    await interaction.followup.send(f"⚔️ Duel finished! <@{winner_id}> defeated <@{loser_id}> in **{category}**! (+{winner_gain} / {loser_loss} ELO)")
+    await check_win_trading(winner_id, loser_id, category, winner_gain)
+
+PVP_BUTTON_HANDLERS = {
+    "page": handle_page_button,
+    "duel": handle_duel_button,
+    "result": handle_result_button,
+    "lb": handle_leaderboard_button,
+}
+
+class PvPButton(discord.ui.DynamicItem[discord.ui.Button], template=r"pvp:(?P<kind>[a-z]+):(?P<args>[\w:.+-]+)"):
+    """Single dispatcher for every stateless button; registered once in setup_hook."""
+
+    def __init__(self, kind: str, args: str, *, label: str | None = None,
+                 style: discord.ButtonStyle = discord.ButtonStyle.secondary, row: int | None = None):
+        super().__init__(discord.ui.Button(label=label, style=style, custom_id=f"pvp:{kind}:{args}", row=row))
+        self.kind = kind
+        self.args = args
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(match["kind"], match["args"], label=item.label, style=item.style, row=item.row)
+
+    async def callback(self, interaction: discord.Interaction):
+        handler = PVP_BUTTON_HANDLERS.get(self.kind)
+        if handler is None:
+            await interaction.response.send_message("❌ This button is no longer supported.", ephemeral=True)
+            return
+        await handler(interaction, self.args.split(":"))
 
 def calculate_elo_change(winner_elo: int, loser_elo: int, kill_difference: int = 1) -> tuple[int, int]:
     """
@@ -494,16 +1988,41 @@ def calculate_elo_change(winner_elo: int, loser_elo: int, kill_difference: int =
 
 def is_banned(user_id: int) -> bool:
     """Check if a user is banned."""
-    c.execute("SELECT 1 FROM bans WHERE user_id = ?", (user_id,))
-    return c.fetchone() is not None
+    return storage.is_banned(user_id)
 
 # --- HISTORY LOGGER ---
 def log_history(user_id: int | None, category: str | None, action: str, details: str):
-    c.execute(
-        "INSERT INTO history (user_id, category, action, details) VALUES (?, ?, ?, ?)",
-        (user_id, category, action, details),
+    storage.log_history(user_id, category, action, details)
+    storage.commit()
+
+# ---------------- COMMAND SYNC ----------------
+def command_tree_hash(client: PvPBot, guild: discord.Object | None = None) -> str:
+    """Hash of the serialized command tree, as Discord would receive it."""
+    payload = sorted(
+        (cmd.to_dict(client.tree) for cmd in client.tree.get_commands(guild=guild)),
+        key=lambda cmd: (cmd.get("type", 1), cmd["name"]),
     )
-    conn.commit()
+    data = json.dumps({"application_id": client.application_id, "commands": payload}, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+async def sync_commands(client: PvPBot):
+    """Sync slash commands only when the tree changed since the last successful sync."""
+    guild = discord.Object(id=int(SYNC_GUILD_ID)) if SYNC_GUILD_ID else None
+    if guild:
+        client.tree.copy_global_to(guild=guild)
+    key = f"command_hash_guild_{guild.id}" if guild else "command_hash_global"
+    target = f"guild {guild.id}" if guild else "globally"
+
+    current = command_tree_hash(client, guild)
+    if storage.get_meta(key) == current:
+        print(f"Slash commands unchanged, skipped sync ({target}).")
+        return
+
+    started = time.perf_counter()
+    await client.tree.sync(guild=guild)
+    storage.set_meta(key, current)
+    storage.commit()
+    print(f"Slash commands synced {target} in {time.perf_counter() - started:.2f}s.")
 
 # ---------------- SLASH COMMANDS ----------------
 
@@ -519,30 +2038,95 @@ async def register(interaction: discord.Interaction, user: discord.User = None):
         return
     
     # Check if user exists in any category
-    c.execute("SELECT COUNT(*) FROM players WHERE user_id = ?", (user_id,))
-    count = c.fetchone()[0]
-    
-    if count > 0:
+    if player_store.overall(user_id) is not None:
         await interaction.response.send_message(f"❌ {target_user.mention} is already registered!", ephemeral=True)
     else:
         # Create entries for all categories
+        storage.register_players([user_id], CATEGORIES)
         for cat in CATEGORIES:
-            c.execute("INSERT INTO players (user_id, category) VALUES (?, ?)", (user_id, cat))
-        conn.commit()
+            player_store.refresh(user_id, cat)
+        live_leaderboards.mark_dirty()
         await interaction.response.send_message(f"✅ {target_user.mention} registered for all categories!")
 
+BULK_REGISTER_CHUNK = 1000
+
+def bulk_register_players(user_ids: list[int]) -> int:
+    """Register many users for every category in one transaction. Returns rows inserted."""
+    inserted = storage.register_players(user_ids, CATEGORIES)
+    player_store.load()
+    live_leaderboards.mark_dirty()
+    return inserted
+
+@bot.tree.command(name="bulkregister", description="Register every member of a role (or the whole server)")
+@app_commands.default_permissions(administrator=True)
+async def bulkregister(interaction: discord.Interaction, role: discord.Role | None = None):
+    if interaction.guild is None:
+        await interaction.response.send_message("❌ This command can only be used in a server!", ephemeral=True)
+        return
+    if not bot.intents.members:
+        await interaction.response.send_message(
+            "❌ Bulk registration needs the Server Members intent. Enable it in the Developer Portal and set MEMBERS_INTENT=1.",
+            ephemeral=True
+        )
+        return
+
+    await interaction.response.defer(thinking=True)
+    target_label = role.mention if role else "the whole server"
+
+    # Load bans once instead of querying per member
+    banned = storage.banned_ids()
+
+    user_ids = []
+    eligible = []
+    scanned = skipped_banned = skipped_bots = 0
+    async for member in interaction.guild.fetch_members(limit=None):
+        scanned += 1
+        if role is not None and member.get_role(role.id) is None:
+            continue
+        if member.bot:
+            skipped_bots += 1
+        elif member.id in banned:
+            skipped_banned += 1
+        else:
+            user_ids.append(member.id)
+            eligible.append(member)
+
+        if scanned % BULK_REGISTER_CHUNK == 0:
+            await interaction.edit_original_response(
+                content=f"⏳ Scanning {target_label}... {scanned} members checked, {len(user_ids)} eligible"
+            )
+
+    # No awaits from here until the commit, so nothing else can interleave with the transaction
+    inserted = bulk_register_players(user_ids)
+    remember_names(eligible)
+
+    log_history(
+        None,
+        None,
+        "bulk_register",
+        f"Admin {interaction.user.display_name} bulk registered {target_label} ({inserted} new rows)"
+    )
+
+    await interaction.edit_original_response(
+        content=(
+            f"✅ Bulk registration for {target_label} done!\n"
+            f"Members checked: {scanned}\n"
+            f"Eligible: {len(user_ids)} ({inserted} new category rows)\n"
+            f"Skipped: {skipped_banned} banned, {skipped_bots} bots"
+        )
+    )
+
 @bot.tree.command(name="remove", description="Remove a player from the database")
 @app_commands.default_permissions(administrator=True)
 async def remove(interaction: discord.Interaction, user: discord.User = None):
     target_id = user.id if user else interaction.user.id
-    c.execute("SELECT * FROM players WHERE user_id = ?", (target_id,))
-    existing = c.fetchone()
-    if not existing:
+    if player_store.overall(target_id) is None:
         target_name = user.mention if user else "You"
         await interaction.response.send_message(f"❌ {target_name} is not registered!", ephemeral=True)
     else:
-        c.execute("DELETE FROM players WHERE user_id = ?", (target_id,))
-        conn.commit()
+        storage.delete_players([target_id])
+        player_store.remove_user(target_id)
+        live_leaderboards.mark_dirty()
         target_name = user.mention if user else interaction.user.mention
         await interaction.response.send_message(f"🗑️ {target_name} removed from all categories!")
 
@@ -553,8 +2137,8 @@ async def ban(interaction: discord.Interaction, user: discord.User, reason: str
         await interaction.response.send_message(f"❌ {user.mention} is already banned!", ephemeral=True)
         return
     
-    c.execute("INSERT INTO bans (user_id, reason) VALUES (?, ?)", (user.id, reason))
-    conn.commit()
+    storage.add_ban(user.id, reason)
+    storage.commit()
     await interaction.response.send_message(f"🔒 {user.mention} has been banned! Reason: {reason}")
 
 @bot.tree.command(name="unban", description="Unban a player")
@@ -564,15 +2148,14 @@ async def unban(interaction: discord.Interaction, user: discord.User):
         await interaction.response.send_message(f"❌ {user.mention} is not banned!", ephemeral=True)
         return
     
-    c.execute("DELETE FROM bans WHERE user_id = ?", (user.id,))
-    conn.commit()
+    storage.remove_ban(user.id)
+    storage.commit()
     await interaction.response.send_message(f"🔓 {user.mention} has been unbanned!")
 
 @bot.tree.command(name="banlist", description="View all banned players")
 @app_commands.default_permissions(administrator=True)
 async def banlist(interaction: discord.Interaction):
-    c.execute("SELECT user_id, reason, banned_at FROM bans ORDER BY banned_at DESC")
-    bans = c.fetchall()
+    bans = storage.list_bans()
     
     if not bans:
         await interaction.response.send_message("✅ No banned players!", ephemeral=True)
@@ -586,49 +2169,37 @@ async def banlist(interaction: discord.Interaction):
 
 @bot.tree.command(name="edit", description="Edit player stats")
 @app_commands.default_permissions(administrator=True)
-async def edit(interaction: discord.Interaction, user: discord.User, category: str = "sword", kills: int = None, deaths: int = None, wins: int = None, losses: int = None, elo: int = None, winstreak: int = None):
+async def edit(interaction: discord.Interaction, user: str, category: str = "sword", kills: int = None, deaths: int = None, wins: int = None, losses: int = None, elo: int = None, winstreak: int = None):
+    query_text, user = user, await resolve_player_arg(user)
+    if user is None:
+        await interaction.response.send_message(f"❌ Couldn't find a player matching `{query_text}`!", ephemeral=True)
+        return
+
     if category not in CATEGORIES:
         await interaction.response.send_message(f"❌ Invalid category! Choose from: {', '.join(CATEGORIES)}", ephemeral=True)
         return
     
-    c.execute("SELECT * FROM players WHERE user_id = ? AND category = ?", (user.id, category))
-    player = c.fetchone()
+    player = player_store.get(user.id, category)
     if not player:
         await interaction.response.send_message(f"❌ {user.mention} has no stats in **{category}**!", ephemeral=True)
         return
     
-    updates = []
-    params = []
-    if kills is not None:
-        updates.append("kills = ?")
-        params.append(kills)
-    if deaths is not None:
-        updates.append("deaths = ?")
-        params.append(deaths)
-    if wins is not None:
-        updates.append("wins = ?")
-        params.append(wins)
-    if losses is not None:
-        updates.append("losses = ?")
-        params.append(losses)
-    if elo is not None:
-        if elo < 0:
-            elo = 0
-        updates.append("elo = ?")
-        params.append(elo)
-    if winstreak is not None:
-        updates.append("winstreak = ?")
-        params.append(winstreak)
+    if elo is not None and elo < 0:
+        elo = 0
+    updates = {
+        name: value
+        for name, value in (("kills", kills), ("deaths", deaths), ("wins", wins), ("losses", losses), ("elo", elo), ("winstreak", winstreak))
+        if value is not None
+    }
     
     if not updates:
         await interaction.response.send_message(f"❌ No stats provided to update!", ephemeral=True)
         return
     
-    params.append(user.id)
-    params.append(category)
-    query = "UPDATE players SET " + ", ".join(updates) + " WHERE user_id = ? AND category = ?"
-    c.execute(query, params)
-    conn.commit()
+    storage.update_player(user.id, category, updates)
+    storage.commit()
+    player_store.refresh(user.id, category)
+    live_leaderboards.mark_dirty(category)
 
     log_history(
         user.id,
@@ -661,24 +2232,7 @@ async def report(interaction: discord.Interaction, winner: discord.User, loser:
         await interaction.response.send_message(f"❌ Invalid category! Choose from: {', '.join(CATEGORIES)}", ephemeral=True)
         return
     
-    winner_data = get_player(winner.id, category)
-    loser_data = get_player(loser.id, category)
-
-    # row layout: user_id, category, kills, deaths, wins, losses, winstreak, elo
-    winner_elo = winner_data[7]
-    loser_elo = loser_data[7]
-    
-    winner_gain, loser_loss = calculate_elo_change(winner_elo, loser_elo, kills)
-    
-    c.execute(
-    "UPDATE players SET kills = MAX(0, kills + ?), wins = wins + 1, winstreak = winstreak + 1, elo = MAX(0, elo + ?) WHERE user_id = ? AND category = ?",
-    (kills, winner_gain, winner.id, category)
-    )
-    c.execute(
-        "UPDATE players SET deaths = MAX(0, deaths + ?), losses = losses + 1, winstreak = 0, elo = MAX(0, elo + ?) WHERE user_id = ? AND category = ?",
-        (kills, loser_loss, loser.id, category)
-    )
-    conn.commit()
+    winner_gain, loser_loss = await apply_match(winner.id, loser.id, category, kills)
 
     log_history(
         winner.id,
@@ -688,6 +2242,7 @@ async def report(interaction: discord.Interaction, winner: discord.User, loser:
     )
 
     await interaction.response.send_message(f"⚔️ {winner.mention} defeated {loser.mention} in **{category}**! (+{winner_gain} / {loser_loss} ELO)")
+    await check_win_trading(winner.id, loser.id, category, winner_gain)
 
 @bot.tree.command(name="duel", description="Challenge a player to a duel")
 async def duel(interaction: discord.Interaction, opponent: discord.User, category: str = "sword", kills: int = 1):
@@ -710,7 +2265,7 @@ async def duel(interaction: discord.Interaction, opponent: discord.User, categor
         return
     
     # Create duel view
-    view = DuelView(challenger, opponent, category, kills)
+    view = duel_view(challenger.id, opponent.id, category, kills)
     
     # Send notification to opponent
     embed = discord.Embed(title="⚔️ Duel Challenge", color=0xff6600)
@@ -725,27 +2280,19 @@ async def duel(interaction: discord.Interaction, opponent: discord.User, categor
 @bot.tree.command(name="stats", description="View player stats")
 async def stats(
     interaction: discord.Interaction,
-    user: discord.User | None = None,
+    user: str | None = None,
     category: str | None = None,
 ):
-    target_user = user or interaction.user
+    target_user = await resolve_player_arg(user) if user else interaction.user
+    if target_user is None:
+        await interaction.response.send_message(f"❌ Couldn't find a player matching `{user}`!", ephemeral=True)
+        return
 
     # -------------------------
     # OVERALL STATS
     # -------------------------
     if category is None:
-        c.execute("""
-            SELECT
-                SUM(kills),
-                SUM(deaths),
-                SUM(wins),
-                SUM(losses),
-                MAX(winstreak),
-                AVG(elo)
-            FROM players
-            WHERE user_id = ?
-        """, (target_user.id,))
-        row = c.fetchone()
+        row = player_store.overall(target_user.id)
 
         if not row or row[0] is None:
             await interaction.response.send_message(
@@ -770,7 +2317,7 @@ async def stats(
         embed.add_field(name="Best Win Streak", value=streak)
         embed.add_field(name="Average Elo", value=elo_display)
 
-        view = CategoryPager("stats", target_user=target_user, start=-1)
+        view = pager_view("stats", -1, target_user.id)
         await interaction.response.send_message(embed=embed, view=view)
         return
 
@@ -801,116 +2348,73 @@ async def stats(
     embed.add_field(name="Elo", value=elo)
 
     idx = CATEGORIES.index(category)
-    view = CategoryPager("stats", target_user=target_user, start=idx)
+    view = pager_view("stats", idx, target_user.id)
 
     await interaction.response.send_message(embed=embed, view=view)
 
 @bot.tree.command(name="leaderboard", description="Top PvP players")
 async def leaderboard(interaction: discord.Interaction, category: str | None = None):
-    # -------------------------
-    # OVERALL LEADERBOARD
-    # -------------------------
-    if category is None:
-        c.execute("""
-            SELECT user_id, AVG(elo) AS avg_elo
-            FROM players
-            GROUP BY user_id
-            ORDER BY avg_elo DESC
-            LIMIT 10
-        """)
-        top = c.fetchall()
-
-        embed = discord.Embed(title="🏆 Overall Leaderboard", color=0xffd700)
-
-        for i, (user_id, avg_elo) in enumerate(top, start=1):
-            try:
-                user = await bot.fetch_user(user_id)
-                display = user.display_name if user else f"Unknown ({user_id})"
-            except:
-                display = f"Unknown ({user_id})"
-
-            embed.add_field(
-                name=f"#{i} {display}",
-                value=f"Average Elo: {int(round(avg_elo))}",
-                inline=False
-            )
-
-        # ⭐ NEW: Add pager arrows even for overall leaderboard
-        view = CategoryPager("leaderboard", start=-1)  # -1 means "overall"
-
-        await interaction.response.send_message(embed=embed, view=view)
-        return
-
-    # -------------------------
-    # CATEGORY LEADERBOARD
-    # -------------------------
-    if category not in CATEGORIES:
+    if category is not None and category not in CATEGORIES:
         await interaction.response.send_message(
             f"❌ Invalid category! Choose from: {', '.join(CATEGORIES)}",
             ephemeral=True
         )
         return
 
-    c.execute(
-        "SELECT user_id, elo FROM players WHERE category = ? ORDER BY elo DESC LIMIT 10",
-        (category,)
-    )
-    top = c.fetchall()
+    scope = category or "all"
+    page, rows, has_next = fetch_leaderboard_page(scope, "page", 1)
+    embed, view = await render_leaderboard(scope, page, rows, has_next)
 
-    embed = discord.Embed(title=f"🏆 {category.upper()} Leaderboard", color=0xffd700)
+    await interaction.response.send_message(embed=embed, view=view)
 
-    for i, (user_id, elo) in enumerate(top, start=1):
-        try:
-            user = await bot.fetch_user(user_id)
-            display = user.display_name if user else f"Unknown ({user_id})"
-        except:
-            display = f"Unknown ({user_id})"
+@bot.tree.command(name="liveleaderboard", description="Post a leaderboard that updates itself (or turn one off)")
+@app_commands.default_permissions(administrator=True)
+async def liveleaderboard(interaction: discord.Interaction, category: str, channel: discord.TextChannel | None = None, enabled: bool = True):
+    if category not in CATEGORIES:
+        await interaction.response.send_message(f"❌ Invalid category! Choose from: {', '.join(CATEGORIES)}", ephemeral=True)
+        return
 
-        embed.add_field(
-            name=f"#{i} {display}",
-            value=f"Elo: {elo}",
-            inline=False
-        )
+    if not enabled:
+        if live_leaderboards.remove_target(category) is None:
+            await interaction.response.send_message(f"❌ There's no live **{category}** leaderboard!", ephemeral=True)
+        else:
+            await interaction.response.send_message(f"🛑 The live **{category}** leaderboard will no longer update.", ephemeral=True)
+        return
 
-    idx = CATEGORIES.index(category)
-    view = CategoryPager("leaderboard", start=idx)
+    channel = channel or interaction.channel
+    try:
+        message = await channel.send(embed=live_leaderboard_embed(category))
+    except discord.HTTPException as e:
+        await interaction.response.send_message(f"❌ Couldn't post in {channel.mention}: {e}", ephemeral=True)
+        return
 
-    await interaction.response.send_message(embed=embed, view=view)
+    # Replaces any previous live board for this category; the old message just stops updating
+    live_leaderboards.set_target(category, channel.id, message.id)
+    await interaction.response.send_message(f"📡 Live **{category}** leaderboard posted in {channel.mention}!", ephemeral=True)
 
 @bot.tree.command(name="mace", description="Top 10 Mace players")
 async def mace_lb(interaction: discord.Interaction):
-    c.execute("SELECT user_id, elo FROM players WHERE category = ? ORDER BY elo DESC LIMIT 10", ("mace",))
-    top = c.fetchall()
+    top = top_players("mace")
 
     embed = discord.Embed(title="🏆 Mace Leaderboard", color=0xffd700)
     for i, (user_id, elo) in enumerate(top, start=1):
-        try:
-            user = await bot.fetch_user(user_id)
-            display = user.display_name if user else f"Unknown ({user_id})"
-        except:
-            display = f"Unknown ({user_id})"
+        display = await display_name_for(user_id)
         embed.add_field(name=f"#{i} {display}", value=f"Elo: {elo}", inline=False)
     await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name="crystal", description="Top 10 Crystal players")
 async def crystal_lb(interaction: discord.Interaction):
-    c.execute("SELECT user_id, elo FROM players WHERE category = ? ORDER BY elo DESC LIMIT 10", ("crystal",))
-    top = c.fetchall()
+    top = top_players("crystal")
 
     embed = discord.Embed(title="🏆 Crystal Leaderboard", color=0xffd700)
     for i, (user_id, elo) in enumerate(top, start=1):
-        try:
-            user = await bot.fetch_user(user_id)
-            display = user.display_name if user else f"Unknown ({user_id})"
-        except:
-            display = f"Unknown ({user_id})"
+        display = await display_name_for(user_id)
         embed.add_field(name=f"#{i} {display}", value=f"Elo: {elo}", inline=False)
     await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name="uhc", description="Top 10 UHC players")
 async def uhc_lb(interaction: discord.Interaction):
-    c.execute("SELECT user_id, elo FROM players WHERE category = ? ORDER BY elo DESC LIMIT 10", ("uhc",))
-    top = c.fetchall()
+    top = top_players("uhc")
 
     embed = discord.Embed(title="🏆 UHC Leaderboard", color=0xffd700)
     for i, (user_id, elo) in enumerate(top, start=1):
@@ -921,47 +2425,98 @@ async def uhc_lb(interaction: discord.Interaction):
         except:
             pass
     await interaction.response.send_message(embed=embed)
+
+# ---------------- WIPE ----------------
+WIPE_LOOKUP_CONCURRENCY = 10
+WIPE_PROGRESS_EVERY = 250
+
+# user_id -> is_bot, shared across wipes so repeat runs skip the API
+_bot_flag_cache: dict[int, bool] = {}
+
+async def resolve_bot_flags(user_ids: list[int], progress=None) -> dict[int, bool]:
+    """Resolve which user IDs are bots using the client cache, then a limited number of parallel fetches."""
+    semaphore = asyncio.Semaphore(WIPE_LOOKUP_CONCURRENCY)
+    done = 0
+
+    async def lookup(user_id: int):
+        nonlocal done
+        if user_id not in _bot_flag_cache:
+            user = bot.get_user(user_id)
+            if user is None:
+                async with semaphore:
+                    try:
+                        user = await bot.fetch_user(user_id)
+                    except discord.NotFound:
+                        user = None
+            # Unknown users are treated like regular users, same as before
+            _bot_flag_cache[user_id] = bool(user and user.bot)
+        done += 1
+        if progress and done % WIPE_PROGRESS_EVERY == 0:
+            await progress(done)
+
+    await asyncio.gather(*(lookup(uid) for uid in user_ids))
+    return {uid: _bot_flag_cache[uid] for uid in user_ids}
+
+def wipe_players(user_ids: list[int]) -> int:
+    """Delete every row for the given user IDs in one transaction. Returns rows deleted."""
+    deleted = storage.delete_players(user_ids)
+    player_store.load()
+    live_leaderboards.mark_dirty()
+    return deleted
+
+@bot.tree.command(name="wipe", description="Remove all non-bot players from the database")
 @app_commands.default_permissions(administrator=True)
-async def wipe(interaction: discord.Interaction):
+async def wipe(interaction: discord.Interaction, dry_run: bool = True):
+    await interaction.response.defer(thinking=True)
     try:
-        c.execute("SELECT DISTINCT user_id FROM players")
-        user_ids = c.fetchall()
-        
-        deleted = 0
-        for (user_id,) in user_ids:
-            try:
-                user = await bot.fetch_user(user_id)
-                if not user.bot:  # Delete non-bot users
-                    c.execute("DELETE FROM players WHERE user_id = ?", (user_id,))
-                    deleted += 1
-            except:
-                # User not found, delete anyway
-                c.execute("DELETE FROM players WHERE user_id = ?", (user_id,))
-                deleted += 1
-        
-        conn.commit()
-        await interaction.response.send_message(f"✅ Wiped {deleted} non-bot players from database!")
+        user_ids = list(dict.fromkeys(player_store.user_ids))
+
+        async def progress(done: int):
+            await interaction.edit_original_response(content=f"⏳ Checking players... {done}/{len(user_ids)}")
+
+        flags = await resolve_bot_flags(user_ids, progress)
+        wipe_ids = [uid for uid, is_bot in flags.items() if not is_bot]
+        to_delete = len(wipe_ids)
+
+        if dry_run:
+            await interaction.edit_original_response(
+                content=f"🧪 Dry run: {to_delete} non-bot players would be wiped ({len(user_ids) - to_delete} bots kept). Run again with `dry_run: False` to wipe."
+            )
+            return
+
+        deleted_rows = wipe_players(wipe_ids)
+
+        log_history(
+            None,
+            None,
+            "wipe",
+            f"Admin {interaction.user.display_name} wiped {to_delete} non-bot players ({deleted_rows} rows)"
+        )
+        await interaction.edit_original_response(content=f"✅ Wiped {to_delete} non-bot players from database!")
     except Exception as e:
-        await interaction.response.send_message(f"❌ Error: {e}", ephemeral=True)
+        await interaction.edit_original_response(content=f"❌ Error: {e}")
 
 @bot.tree.command(name="reset", description="Reset a player's stats in a category")
 @app_commands.default_permissions(administrator=True)
-async def reset(interaction: discord.Interaction, user: discord.User, category: str = "sword"):
+async def reset(interaction: discord.Interaction, user: str, category: str = "sword"):
+    query_text, user = user, await resolve_player_arg(user)
+    if user is None:
+        await interaction.response.send_message(f"❌ Couldn't find a player matching `{query_text}`!", ephemeral=True)
+        return
+
     if category not in CATEGORIES:
         await interaction.response.send_message(f"❌ Invalid category! Choose from: {', '.join(CATEGORIES)}", ephemeral=True)
         return
     
-    c.execute("SELECT * FROM players WHERE user_id = ? AND category = ?", (user.id, category))
-    player = c.fetchone()
+    player = player_store.get(user.id, category)
     if not player:
         await interaction.response.send_message(f"❌ {user.mention} has no stats in **{category}**!", ephemeral=True)
         return
     
-    c.execute(
-        "UPDATE players SET kills = 0, deaths = 0, wins = 0, losses = 0, winstreak = 0, elo = 1000 WHERE user_id = ? AND category = ?",
-        (user.id, category)
-    )
-    conn.commit()
+    storage.update_player(user.id, category, {"kills": 0, "deaths": 0, "wins": 0, "losses": 0, "winstreak": 0, "elo": 1000})
+    storage.commit()
+    player_store.refresh(user.id, category)
+    live_leaderboards.mark_dirty(category)
 
     log_history(
         user.id,
@@ -975,27 +2530,17 @@ async def reset(interaction: discord.Interaction, user: discord.User, category:
 @bot.tree.command(name="history", description="Show recent PvP history (reports, edits, duels, etc.)")
 async def history(
     interaction: discord.Interaction,
-    user: discord.User | None = None,
+    user: str | None = None,
     category: str | None = None
 ):
-    params = []
-    query = "SELECT user_id, category, action, details, created_at FROM history WHERE 1=1"
-
-    # Filter by user
     if user is not None:
-        query += " AND user_id = ?"
-        params.append(user.id)
-
-    # Filter by category
-    if category is not None:
-        query += " AND category = ?"
-        params.append(category)
-
-    # Sort newest → oldest
-    query += " ORDER BY created_at DESC LIMIT 20"
+        query_text, user = user, await resolve_player_arg(user)
+        if user is None:
+            await interaction.response.send_message(f"❌ Couldn't find a player matching `{query_text}`!", ephemeral=True)
+            return
 
-    c.execute(query, params)
-    rows = c.fetchall()
+    # Newest → oldest
+    rows = storage.recent_history(user.id if user is not None else None, category, limit=20)
 
     if not rows:
         await interaction.response.send_message("📭 No history found for that filter.", ephemeral=True)
@@ -1025,14 +2570,372 @@ async def history(
 
     await interaction.response.send_message(embed=embed)
 
+# ---------------- HEAD TO HEAD ----------------
+H2H_UNAVAILABLE = "❌ Head-to-head stats are only available on the SQLite storage backend!"
+MATCH_DETAILS_RE = re.compile(r"^(?P<winner>.+) defeated (?P<loser>.+) \(kills: (?P<kills>-?\d+), ")
+
+@bot.tree.command(name="h2h", description="Show how two players fare against each other")
+async def h2h(interaction: discord.Interaction, player_a: discord.User, player_b: discord.User, category: str | None = None):
+    if conn is None:
+        await interaction.response.send_message(H2H_UNAVAILABLE, ephemeral=True)
+        return
+    if player_a.id == player_b.id:
+        await interaction.response.send_message("❌ Pick two different players!", ephemeral=True)
+        return
+
+    # Rows are stored with the lower ID first
+    first, second = (player_a, player_b) if player_a.id < player_b.id else (player_b, player_a)
+
+    if category is None:
+        c.execute(
+            "SELECT SUM(a_wins), SUM(b_wins), SUM(a_kills), SUM(b_kills) FROM head_to_head WHERE player_a = ? AND player_b = ?",
+            (first.id, second.id)
+        )
+    else:
+        if category not in CATEGORIES:
+            await interaction.response.send_message(f"❌ Invalid category! Choose from: {', '.join(CATEGORIES)}", ephemeral=True)
+            return
+        c.execute(
+            "SELECT a_wins, b_wins, a_kills, b_kills FROM head_to_head WHERE category = ? AND player_a = ? AND player_b = ?",
+            (category, first.id, second.id)
+        )
+    row = c.fetchone()
+
+    if not row or row[0] is None:
+        await interaction.response.send_message(f"📭 {player_a.mention} and {player_b.mention} haven't played each other yet!", ephemeral=True)
+        return
+
+    a_wins, b_wins, a_kills, b_kills = row
+    if first.id != player_a.id:
+        a_wins, b_wins, a_kills, b_kills = b_wins, a_wins, b_kills, a_kills
+
+    category_label = category.upper() if category else "OVERALL"
+    embed = discord.Embed(title=f"⚔️ {player_a.display_name} vs {player_b.display_name} ({category_label})", color=0xff6600)
+    embed.add_field(name="Matches", value=a_wins + b_wins, inline=False)
+    embed.add_field(name=f"{player_a.display_name} Wins", value=a_wins)
+    embed.add_field(name=f"{player_b.display_name} Wins", value=b_wins)
+    embed.add_field(name="\u200b", value="\u200b")
+    embed.add_field(name=f"{player_a.display_name} Kill Diff", value=a_kills)
+    embed.add_field(name=f"{player_b.display_name} Kill Diff", value=b_kills)
+
+    await interaction.response.send_message(embed=embed)
+
+def _member_ids_by_name() -> dict[str, set[int]]:
+    """Map every cached display/user name to the member IDs using it."""
+    names: dict[str, set[int]] = {}
+    for member in bot.get_all_members():
+        for name in {member.display_name, member.name, member.global_name}:
+            if name:
+                names.setdefault(name, set()).add(member.id)
+    return names
+
+@bot.tree.command(name="h2hbackfill", description="One-time import of old match history into head-to-head stats")
+@app_commands.default_permissions(administrator=True)
+async def h2hbackfill(interaction: discord.Interaction):
+    if conn is None:
+        await interaction.response.send_message(H2H_UNAVAILABLE, ephemeral=True)
+        return
+    # Claim the flag before the first await so concurrent invocations can't both run
+    c.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('h2h_backfilled', 'running')")
+    if c.rowcount == 0:
+        await interaction.response.send_message("❌ Head-to-head history has already been backfilled!", ephemeral=True)
+        return
+
+    try:
+        parsed, unresolved, records = await _backfill_head_to_head(interaction)
+    except Exception:
+        c.execute("DELETE FROM meta WHERE key = 'h2h_backfilled'")  # let an admin retry
+        raise
+
+    await interaction.edit_original_response(
+        content=f"✅ Backfilled {parsed} matches into {records} head-to-head records ({unresolved} could not be resolved)."
+    )
+
+async def _backfill_head_to_head(interaction: discord.Interaction) -> tuple[int, int, int]:
+    """Fold pre-h2h match history into head_to_head. Returns (parsed, unresolved, records)."""
+    await interaction.response.defer(thinking=True)
+
+    c.execute("SELECT value FROM meta WHERE key = 'h2h_backfill_before'")
+    row = c.fetchone()
+    before_id = int(row[0]) if row else 1
+
+    # History only stores the loser's display name, so resolve it against cached members
+    names = _member_ids_by_name()
+
+    # (winner, loser, category) -> [matches, kills]
+    totals: dict[tuple[int, int, str], list[int]] = {}
+    parsed = unresolved = 0
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT user_id, category, details FROM history WHERE action IN ('match_report', 'duel_win') AND id < ?",
+        (before_id,)
+    )
+    for winner_id, cat, details in cursor:
+        match = MATCH_DETAILS_RE.match(details or "")
+        if not match or winner_id is None or cat is None:
+            unresolved += 1
+            continue
+        loser_ids = names.get(match["loser"], set()) - {winner_id}
+        if len(loser_ids) != 1:
+            unresolved += 1
+            continue
+        key = (winner_id, loser_ids.pop(), cat)
+        entry = totals.setdefault(key, [0, 0])
+        entry[0] += 1
+        entry[1] += max(0, int(match["kills"]))
+        parsed += 1
+
+    c.execute("BEGIN")
+    try:
+        for (winner_id, loser_id, cat), (matches, kills) in totals.items():
+            storage.record_head_to_head(winner_id, loser_id, cat, kills, matches)
+        c.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('h2h_backfilled', '1')")
+        c.execute("COMMIT")
+    except Exception:
+        c.execute("ROLLBACK")
+        raise
+    return parsed, unresolved, len(totals)
+
+# ---------------- EXPORT ----------------
+EXPORT_DIR = "exports"
+EXPORT_CHUNK = 5000
+EXPORT_QUERIES = {
+    "players": "SELECT user_id, category, kills, deaths, wins, losses, winstreak, elo, last_active FROM players",
+    "history": "SELECT id, user_id, category, action, details, created_at FROM history ORDER BY id",
+    "bans": "SELECT user_id, reason, banned_at FROM bans",
+}
+
+def export_tables(tables: list[str], file_format: str = "csv", out_dir: str = EXPORT_DIR) -> list[tuple[str, int]]:
+    """
+    Stream tables to gzip-compressed CSV or NDJSON files, EXPORT_CHUNK rows at a time.
+    Uses its own read-only connection (safe to run in a thread) and one snapshot for all tables;
+    the database is in WAL mode, so holding that snapshot doesn't block the bot's writes.
+    Returns (path, row count) per table.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    results = []
+    export_conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+    try:
+        export_conn.execute("BEGIN")
+        for table in tables:
+            cursor = export_conn.execute(EXPORT_QUERIES[table])
+            columns = [d[0] for d in cursor.description]
+            path = os.path.join(out_dir, f"{table}_{stamp}.{file_format}.gz")
+            rows = 0
+            with gzip.open(path, "wt", encoding="utf-8", newline="") as f:
+                if file_format == "csv":
+                    writer = csv.writer(f)
+                    writer.writerow(columns)
+                while True:
+                    chunk = cursor.fetchmany(EXPORT_CHUNK)
+                    if not chunk:
+                        break
+                    if file_format == "csv":
+                        writer.writerows(chunk)
+                    else:
+                        f.writelines(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in chunk)
+                    rows += len(chunk)
+            results.append((path, rows))
+    finally:
+        export_conn.close()
+    return results
+
+@bot.tree.command(name="export", description="Export players, history and bans as compressed files")
+@app_commands.default_permissions(administrator=True)
+@app_commands.rename(file_format="format")
+@app_commands.choices(
+    table=[
+        app_commands.Choice(name="All", value="all"),
+        app_commands.Choice(name="Players", value="players"),
+        app_commands.Choice(name="History", value="history"),
+        app_commands.Choice(name="Bans", value="bans"),
+    ],
+    file_format=[
+        app_commands.Choice(name="CSV", value="csv"),
+        app_commands.Choice(name="NDJSON", value="ndjson"),
+    ],
+)
+async def export(interaction: discord.Interaction, table: str = "all", file_format: str = "csv"):
+    if not isinstance(storage, SQLiteStorage):
+        # export_tables reads pvp_stats.db directly, which isn't where this backend keeps its data
+        await interaction.response.send_message("❌ Export is only available on the SQLite storage backend!", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    tables = list(EXPORT_QUERIES) if table == "all" else [table]
+
+    try:
+        results = await asyncio.to_thread(export_tables, tables, file_format)
+    except Exception as e:
+        await interaction.followup.send(f"❌ Export failed: {e}", ephemeral=True)
+        return
+
+    limit = interaction.guild.filesize_limit if interaction.guild else 10 * 1024 * 1024
+    files = []
+    uploaded = []
+    lines = []
+    for path, rows in results:
+        name = os.path.basename(path)
+        if os.path.getsize(path) <= limit:
+            files.append(discord.File(path, filename=name))
+            uploaded.append(path)
+            lines.append(f"📦 `{name}`: {rows} rows")
+        else:
+            lines.append(f"📦 `{name}`: {rows} rows (too large to upload, saved on the bot host)")
+
+    try:
+        await interaction.followup.send("\n".join(lines), files=files, ephemeral=True)
+    finally:
+        for file in files:
+            file.close()
+    # Uploaded copies live in Discord now; only oversized exports are kept on disk
+    for path in uploaded:
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"⚠️ Failed to remove export {path}: {e}")
+
+# ---------------- PROFILING ----------------
+PROFILE_DIR = "profiles"
+PROFILE_MAX_SECONDS = 300
+PROFILE_SAMPLE_INTERVAL = 0.005
+
+class StackSampler:
+    """
+    Sampling profiler for the event loop thread.
+    A background thread snapshots the loop's stack every PROFILE_SAMPLE_INTERVAL seconds and
+    counts collapsed stacks (flamegraph.pl / speedscope format). Nothing runs while it is stopped.
+    """
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: dict[str, int] = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def top_frames(self, limit: int = 10) -> list[tuple[str, int]]:
+        """Innermost frames by sample count."""
+        leaves: dict[str, int] = {}
+        for stack, count in self.counts.items():
+            leaf = stack.rsplit(";", 1)[-1]
+            leaves[leaf] = leaves.get(leaf, 0) + count
+        return sorted(leaves.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+
+_profiling = False
+
+@bot.tree.command(name="profile", description="Profile the bot for a short window (CPU samples + allocations)")
+@app_commands.default_permissions(administrator=True)
+async def profile(interaction: discord.Interaction, seconds: app_commands.Range[int, 5, PROFILE_MAX_SECONDS] = 30):
+    global _profiling
+    if _profiling:
+        await interaction.response.send_message("❌ A profile is already running!", ephemeral=True)
+        return
+    _profiling = True
+    try:
+        await interaction.response.defer(ephemeral=True, thinking=True)
+
+        sampler = StackSampler(threading.get_ident())
+        tracing = tracemalloc.is_tracing()
+        try:
+            if not tracing:
+                tracemalloc.start()
+            sampler.start()
+            await asyncio.sleep(seconds)
+        finally:
+            sampler.stop()
+            snapshot = tracemalloc.take_snapshot()
+            if not tracing:
+                tracemalloc.stop()
+    finally:
+        # Reset even if defer() fails (e.g. expired interaction), or /profile stays locked until restart
+        _profiling = False
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    stacks_path = os.path.join(PROFILE_DIR, f"profile_{stamp}.collapsed")
+    allocs_path = os.path.join(PROFILE_DIR, f"allocations_{stamp}.txt")
+
+    with open(stacks_path, "w", encoding="utf-8") as f:
+        for stack, count in sorted(sampler.counts.items(), key=lambda kv: kv[1], reverse=True):
+            f.write(f"{stack} {count}\n")
+
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    top_allocs = snapshot.statistics("lineno")
+    with open(allocs_path, "w", encoding="utf-8") as f:
+        for stat in top_allocs[:50]:
+            f.write(f"{stat}\n")
+
+    lines = [f"🔬 Profiled {seconds}s, {sampler.samples} samples", "", "**Top frames**"]
+    for frame, count in sampler.top_frames(8):
+        lines.append(f"`{frame}` {count * 100 / max(sampler.samples, 1):.1f}%")
+    lines += ["", "**Top allocations**"]
+    for stat in top_allocs[:5]:
+        where = stat.traceback[0]
+        lines.append(f"`{os.path.basename(where.filename)}:{where.lineno}` {stat.size / 1024:.1f} KiB in {stat.count} blocks")
+
+    await interaction.followup.send(
+        "\n".join(lines)[:2000],
+        files=[discord.File(stacks_path), discord.File(allocs_path)],
+        ephemeral=True,
+    )
+
+@stats.autocomplete("user")
+@edit.autocomplete("user")
+@reset.autocomplete("user")
+@history.autocomplete("user")
+async def _player_autocomplete(interaction: discord.Interaction, current: str):
+    return await player_autocomplete(interaction, current)
+
 @stats.autocomplete("category")
 @leaderboard.autocomplete("category")
 @history.autocomplete("category")
+@h2h.autocomplete("category")
 @report.autocomplete("category")
 @duel.autocomplete("category")
 @edit.autocomplete("category")
 @reset.autocomplete("category")
+@liveleaderboard.autocomplete("category")
 async def _category_autocomplete(interaction: discord.Interaction, current: str):
     return await category_autocomplete(interaction, current)
 
-bot.run(TOKEN)
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "export":
+        # Command-line export: python bot.py export [--table players] [--format ndjson] [--out exports]
+        parser = argparse.ArgumentParser(prog="bot.py export")
+        parser.add_argument("--table", choices=["all", *EXPORT_QUERIES], default="all")
+        parser.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+        parser.add_argument("--out", default=EXPORT_DIR)
+        args = parser.parse_args(sys.argv[2:])
+        # Read-only: don't open storage, which would restore the JSON backup over the live database
+        if not os.path.exists(DB_PATH):
+            sys.exit(f"❌ {DB_PATH} not found")
+        tables = list(EXPORT_QUERIES) if args.table == "all" else [args.table]
+        for path, rows in export_tables(tables, args.format, args.out):
+            print(f"📦 {path}: {rows} rows")
+    else:
+        bot.run(TOKEN)